@@ -1,22 +1,285 @@
+import csv
+import io
+import os
+import queue
+import threading
+
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 import pyarrow.parquet as pq
 
+from parquet_layout import ParquetLayout, apply_schema
+
+# Arrow's CSV parser only takes a one-byte delimiter; "¦" is two bytes in UTF-8,
+# so the file is streamed through _DelimiterTranscoder with this byte in its place.
+ARROW_DELIMITER = "\x1f"  # ASCII unit separator
+
+_DELIMITER_CLASH = (
+    "Input contains the byte 0x1f used in place of the delimiter; "
+    "use engine='pandas' for this file."
+)
+
+
+class _DelimiterTranscoder(io.RawIOBase):
+    """
+    Read-only binary stream over `raw` with every `old` delimiter replaced by
+    the single byte `new`. A delimiter cut in two by a read is held back until
+    the next read completes it.
+    """
+
+    def __init__(self, raw, old, new):
+        self.raw = raw
+        self.old = old
+        self.new = new
+        self._pending = b""  # raw bytes that may start a delimiter
+        self._ready = b""    # transcoded bytes not handed out yet
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._ready:
+            chunk = self.raw.read(len(buffer))
+            if self.new in chunk:
+                raise ValueError(_DELIMITER_CLASH)
+            data = self._pending + chunk
+            self._pending = b""
+            if not data:
+                return 0
+            if chunk:
+                # hold back a trailing partial delimiter until the next read
+                for size in range(len(self.old) - 1, 0, -1):
+                    if data.endswith(self.old[:size]):
+                        data, self._pending = data[:-size], data[-size:]
+                        break
+            self._ready = data.replace(self.old, self.new)
+
+        size = min(len(buffer), len(self._ready))
+        buffer[:size] = self._ready[:size]
+        self._ready = self._ready[size:] if size < len(self._ready) else b""
+        return size
+
+
+def read_csv_header(input_path: str, sep: str = "¦"):
+    """Column names from the first record of the CSV."""
+    with open(input_path, "r", encoding="utf-8", newline="") as f:
+        header = next(csv.reader(f, delimiter=sep), None)
+    if not header:
+        raise ValueError("Input CSV appears to be empty.")
+    return header
+
+
+def arrow_csv_options(
+    column_names,
+    sep: str = "¦",
+    has_header: bool = True,
+    block_size_mb: int = 64,
+):
+    """
+    Keyword arguments for pyarrow.csv.read_csv/open_csv reading every column
+    as string (empty fields stay "", as with keep_default_na=False) and keeping
+    quoted newlines inside their field. A multi-byte `sep` is expected to have
+    been replaced by ARROW_DELIMITER in the input (see replace_delimiter()).
+    """
+    delimiter = sep if len(sep.encode("utf-8")) == 1 else ARROW_DELIMITER
+    return {
+        "read_options": pa_csv.ReadOptions(
+            column_names=list(column_names),
+            skip_rows=1 if has_header else 0,
+            block_size=block_size_mb * 1024 * 1024,
+        ),
+        "parse_options": pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+        "convert_options": pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in column_names},
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    }
+
+
+def replace_delimiter(data: bytes, sep: str = "¦"):
+    """In-memory counterpart of _DelimiterTranscoder for a whole block of CSV bytes."""
+    old = sep.encode("utf-8")
+    if len(old) == 1:
+        return data
+    new = ARROW_DELIMITER.encode("ascii")
+    if new in data:
+        raise ValueError(_DELIMITER_CLASH)
+    return data.replace(old, new)
+
+
+def restore_delimiter(data, sep: str = "¦"):
+    """
+    Put `sep` back inside quoted values of a table/record batch parsed from
+    replace_delimiter()/_DelimiterTranscoder output. The input is checked to
+    contain no ARROW_DELIMITER, so every one left in a value was a `sep`.
+    """
+    if len(sep.encode("utf-8")) == 1:
+        return data
+    columns = list(data.columns)
+    changed = False
+    for i, column in enumerate(columns):
+        if pc.any(pc.match_substring(column, ARROW_DELIMITER)).as_py():
+            columns[i] = pc.replace_substring(column, ARROW_DELIMITER, sep)
+            changed = True
+    if not changed:
+        return data
+    return type(data).from_arrays(columns, schema=data.schema)
+
+
+def open_csv_string_batches(
+    source,
+    column_names,
+    sep: str = "¦",
+    block_size_mb: int = 64,
+    has_header: bool = True,
+):
+    """
+    Open an incremental arrow CSV reader that yields all-string record batches
+    (see arrow_csv_options()). With a multi-byte `sep`, pass each batch through
+    restore_delimiter().
+
+    - source: path or binary file object positioned at the first record (or header).
+    - column_names: names of the columns, e.g. from read_csv_header().
+    - block_size_mb: bytes of CSV parsed per record batch.
+    - has_header: skip the first record of `source`.
+    """
+    old = sep.encode("utf-8")
+    if len(old) != 1:
+        if isinstance(source, str):
+            source = open(source, "rb")
+        source = io.BufferedReader(
+            _DelimiterTranscoder(source, old, ARROW_DELIMITER.encode("ascii")),
+            buffer_size=1024 * 1024,
+        )
+
+    return pa_csv.open_csv(source, **arrow_csv_options(column_names, sep, has_header, block_size_mb))
+
+
+def prefetch_batches(batches, depth=2):
+    """
+    Iterate `batches` on a background thread, up to `depth` ahead, so the
+    next blocks are parsed while the caller encodes the current one (both
+    sides release the GIL inside arrow).
+
+    If the caller stops early, close() the generator before closing the
+    source: that stops the reader thread and frees the blocks it holds.
+    """
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # give up once the consumer is gone instead of blocking on a full queue
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        put(done)
+
+    thread = threading.Thread(target=produce, name="csv-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+        while not pending.empty():
+            pending.get_nowait()
+
+
+def read_csv_sample(input_path: str, column_names, sep: str = "¦", rows: int = 100_000):
+    """First `rows` data rows of the CSV as an all-string Table."""
+    batches = []
+    read = 0
+    with open(input_path, "rb") as f:
+        for batch in open_csv_string_batches(f, column_names, sep, block_size_mb=4):
+            batches.append(restore_delimiter(batch, sep))
+            read += batch.num_rows
+            if read >= rows:
+                break
+    schema = pa.schema([(name, pa.string()) for name in column_names])
+    return pa.Table.from_batches(batches, schema=schema).slice(0, rows)
+
+
+def layout_schema(input_path: str, column_names, sep: str = "¦", layout: ParquetLayout = None):
+    """Output schema of a conversion: all strings, or inferred from a sample for a typed layout."""
+    layout = layout or ParquetLayout()
+    sample = None
+    if layout.typed and set(column_names) - set(layout.column_types):
+        print(f"Sampling {layout.sample_rows:,} rows to infer column types...")
+        sample = read_csv_sample(input_path, column_names, sep, layout.sample_rows)
+    schema = layout.schema(column_names, sample)
+    print(f"Parquet layout: {layout.describe(schema)}")
+    return schema
+
+
+def _discard_parquet(parquet_writer, path):
+    # close a writer that failed midway and delete its file: closing writes a
+    # valid footer, so the partial file would otherwise look complete
+    if parquet_writer is not None:
+        try:
+            parquet_writer.close()
+        except Exception:
+            pass
+    if os.path.exists(path):
+        os.remove(path)
+
+
 def convert_csv_to_parquet_all_strings(
     input_path: str,
     output_path: str,
     sep: str = "¦",
     target_ram_gb: int = 18,
-    sample_rows: int = 100_000
+    sample_rows: int = 100_000,
+    engine: str = "pyarrow",
+    block_size_mb: int = 64,
+    layout: ParquetLayout = None,
 ):
     """
-    Convert a large CSV to Parquet (Snappy) using chunking and
-    optimizing chunksize to use approximately `target_ram_gb` of RAM.
+    Convert a large CSV to Parquet (Snappy) with ALL columns read as strings,
+    or with the column types and writer settings of `layout` (see
+    parquet_layout.ParquetLayout, e.g. ParquetLayout(typed=True, compression="zstd")).
 
-    - Reads ALL columns as strings.
-    - Uses pandas for CSV reading and pyarrow for Parquet writing.
-    - Works well for big files (~5GB+) on a 32GB RAM machine.
+    - engine="pyarrow": streams the file through arrow's incremental CSV reader
+      with an all-string schema declared up front and writes each record batch
+      straight to the ParquetWriter (no pandas, no cast). Parsing of the next
+      blocks overlaps with encoding the current one; memory stays around a few
+      `block_size_mb` blocks whatever the file size.
+    - engine="pandas": pandas chunked read_csv, with the chunksize chosen so a
+      chunk takes about `target_ram_gb` of RAM (estimated on `sample_rows`
+      rows), then Table.from_pandas and a cast to the string schema.
+
+    Both engines write the same table. The Parquet file is written next to
+    `output_path` and only renamed to it once complete; on an error nothing is
+    left at `output_path`.
     """
+    layout = layout or ParquetLayout()
+    if engine == "pyarrow":
+        return _convert_csv_to_parquet_arrow(input_path, output_path, sep, block_size_mb, layout)
+    if engine != "pandas":
+        raise ValueError(f"Unknown engine '{engine}', expected 'pyarrow' or 'pandas'")
+    schema = layout_schema(input_path, read_csv_header(input_path, sep), sep, layout)
 
     # ---- Step 1: Sample to estimate memory per row ----
     print(f"Sampling {sample_rows} rows to estimate memory usage...")
@@ -51,47 +314,99 @@ def convert_csv_to_parquet_all_strings(
     parquet_writer = None
     total_rows = 0
     chunk_idx = 0
+    tmp_path = output_path + ".tmp"
 
-    for chunk in pd.read_csv(
-        input_path,
-        sep=sep,
-        dtype=str,
-        keep_default_na=False,
-        chunksize=chunk_rows
-    ):
-        chunk_idx += 1
-        rows_in_chunk = len(chunk)
-        total_rows += rows_in_chunk
-        print(f"Processing chunk {chunk_idx} with {rows_in_chunk:,} rows...")
-
-        # Convert pandas chunk → pyarrow Table
-        table = pa.Table.from_pandas(chunk, preserve_index=False)
-
-        if parquet_writer is None:
-            # Enforce all-string schema
-            string_schema = pa.schema(
-                [(name, pa.string()) for name in table.column_names]
-            )
-            # Cast first table to ensure it matches the schema
-            table = table.cast(string_schema)
-
-            parquet_writer = pq.ParquetWriter(
-                output_path,
-                string_schema,
-                compression="snappy"
-            )
-        else:
-            # Ensure subsequent tables match schema as well
-            table = table.cast(parquet_writer.schema)
-
-        parquet_writer.write_table(table)
+    try:
+        for chunk in pd.read_csv(
+            input_path,
+            sep=sep,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_rows
+        ):
+            chunk_idx += 1
+            rows_in_chunk = len(chunk)
+            total_rows += rows_in_chunk
+            print(f"Processing chunk {chunk_idx} with {rows_in_chunk:,} rows...")
+
+            # Convert pandas chunk → pyarrow Table
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+            if parquet_writer is None:
+                # Enforce all-string schema
+                string_schema = pa.schema(
+                    [(name, pa.string()) for name in table.column_names]
+                )
+
+                parquet_writer = pq.ParquetWriter(
+                    tmp_path,
+                    schema,
+                    **layout.writer_options()
+                )
+
+            # Cast every chunk to strings, then to the layout's column types
+            table = apply_schema(table.cast(string_schema), schema)
+
+            parquet_writer.write_table(table, row_group_size=layout.row_group_size)
+    except BaseException:
+        _discard_parquet(parquet_writer, tmp_path)
+        raise
 
     if parquet_writer:
         parquet_writer.close()
+        os.replace(tmp_path, output_path)
+
+    print(f"✅ Finished writing Parquet: {output_path}")
+    print(f"✅ Total rows processed: {total_rows:,}")
+
+
+def _convert_csv_to_parquet_arrow(input_path, output_path, sep, block_size_mb, layout):
+    column_names = read_csv_header(input_path, sep)
+    schema = layout_schema(input_path, column_names, sep, layout)
+    print(f"Streaming {len(column_names)} columns with pyarrow "
+          f"({block_size_mb} MB blocks)...")
+
+    parquet_writer = None
+    total_rows = 0
+    batch_idx = 0
+    tmp_path = output_path + ".tmp"
+
+    with open(input_path, "rb") as f:
+        reader = open_csv_string_batches(f, column_names, sep, block_size_mb)
+        batches = prefetch_batches(reader)
+        try:
+            for batch in batches:
+                if batch.num_rows == 0:
+                    continue
+                batch_idx += 1
+                total_rows += batch.num_rows
+                print(f"Processing batch {batch_idx} with {batch.num_rows:,} rows...")
+
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(
+                        tmp_path,
+                        schema,
+                        **layout.writer_options()
+                    )
+                batch = apply_schema(restore_delimiter(batch, sep), schema)
+                parquet_writer.write_batch(batch, row_group_size=layout.row_group_size)
+        except BaseException:
+            _discard_parquet(parquet_writer, tmp_path)
+            raise
+        finally:
+            batches.close()
+
+    if total_rows == 0:
+        raise ValueError("CSV has 0 rows. Is the CSV file empty?")
+    parquet_writer.close()
+    os.replace(tmp_path, output_path)
 
     print(f"✅ Finished writing Parquet: {output_path}")
     print(f"✅ Total rows processed: {total_rows:,}")
 
 
 # Example usage:
-# convert_csv_to_parquet_all_strings("bigfile.csv", "bigfile.parquet")
\ No newline at end of file
+# convert_csv_to_parquet_all_strings("bigfile.csv", "bigfile.parquet")
+# convert_csv_to_parquet_all_strings("bigfile.csv", "bigfile.parquet", engine="pandas", target_ram_gb=8)
+# convert_csv_to_parquet_all_strings("bigfile.csv", "bigfile.parquet",
+#                                    layout=ParquetLayout(typed=True, compression="zstd", compression_level=3))
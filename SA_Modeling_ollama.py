@@ -6,22 +6,532 @@ import re
 import emoji
 import unicodedata
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import asyncio
+import random
+from collections import deque
+import threading
+import time
+import socket
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 import json
-import io
+import copy
+import pyarrow as pa
+import pyarrow.parquet as pq
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import BotoCoreError, ClientError
+from prediction_cache import PredictionCache
+from concurrency_limiter import AIMDConcurrencyLimiter
+from endpoint_pool import EndpointPool
+from request_metrics import RequestMetrics
+from chat_tasks import SA_SYSTEM_PROMPT, ChatTask
+
+
+# Patterns used by clean_text / clean_series, compiled once at import
+MENTION_PATTERN = re.compile(r'@[\w\.\-_]+')
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+SPECIAL_CHAR_PATTERN = re.compile(r'[^\w\s\u0621-\u064A]+', re.UNICODE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+MODEL_NAME = "yasserrmd/ALLaM-7B-Instruct-preview"
+DEFAULT_CHAT_URL = "http://localhost:5000/v1/api/chat"
+API_HEADERS = {
+    'Content-Type': 'application/json',
+    'Authorization': 'Bearer demo'
+}
+
+COMMENTS_CLASSIFICATION_SYSTEM_PROMPT = "You are a precise text classifier.\n\nTASK\nClassify the TEXT into exactly one label from LABELS.\n\nRULES\n- Choose the single best label (no ties).\n- Prefer \"Other\" if ambiguous.\n- OUTPUT MUST BE ONLY ONE JSON OBJECT. NO EXTRA TEXT.\n\nFORMAT\n{\"label\": \"<one of the labels>\", \"confidence\": <0..1>, \"reason\": \"<max 20 words>\"}\n\nLABELS {\"Mobile App\", \"auto_loan\", \"Credit/Debit Card\", \"Loan\", \"Prizes\", \"Competition\", \"Customer Service\", \"Other\"}\n\nGUIDANCE\n- Text may be English or Arabic (or mixed).\n- If meaning unclear → label = \"Other\".\n- DO NOT write explanations outside JSON.\n\nWhen you see TEXT:, classify it using the format above.\nAfter TEXT:, reply ONLY with JSON.\n"
+
+POSTS_CLASSIFICATION_SYSTEM_PROMPT = "You are a precise banking text classifier.\n\nTASK\nClassify the TEXT into exactly one label from LABELS.\n\nRULES\n- Choose the single best label (no ties).\n- Prefer \"Other\" if ambiguous.\n- OUTPUT MUST BE ONLY ONE JSON OBJECT. NO EXTRA TEXT.\n\nFORMAT\n{\"label\": \"<one of the labels>\", \"confidence\": <0..1>, \"reason\": \"<max 20 words>\"}\n\nLABELS {\"Mobile App\", \"auto_loan\", \"Credit/Debit Card\", \"Loan\", \"Prizes\", \"Competition\", \"Customer Service\", \"Other\"}\n\nGUIDANCE\n- Text may be English or Arabic (or mixed).\n- If meaning unclear → label = \"Other\".\n- DO NOT write explanations outside JSON.\n\nWhen you see TEXT:, classify it using the format above.\nAfter TEXT:, reply ONLY with JSON.\n"
+
+SENTIMENT_LABELS = ["Positive", "Neutral", "Negative"]
+COMMENT_LABELS = ["Mobile App", "auto_loan", "Credit/Debit Card", "Loan", "Prizes", "Competition", "Customer Service", "Other"]
+
+# Sentiment + comment classification in a single request (task_mode="combined")
+COMBINED_SYSTEM_PROMPT = (
+    "You are a precise sentiment and text classifier.\n\n"
+    "TASK\nFor the TEXT, give its sentiment (one of SENTIMENTS) and its label (one of LABELS).\n\n"
+    "RULES\n"
+    "- Choose the single best sentiment and the single best label (no ties).\n"
+    "- Prefer \"Neutral\" sentiment if ambiguous.\n"
+    "- Prefer \"Other\" label if ambiguous.\n"
+    "- Consider negation, sarcasm, contrast.\n"
+    "- OUTPUT MUST BE ONLY ONE JSON OBJECT. NO EXTRA TEXT.\n\n"
+    "FORMAT\n"
+    "{\"sentiment\": \"<one of SENTIMENTS>\", \"sentiment_confidence\": <0..1>, "
+    "\"label\": \"<one of LABELS>\", \"label_confidence\": <0..1>, \"reason\": \"<max 20 words>\"}\n\n"
+    "SENTIMENTS {Positive, Neutral, Negative}\n\n"
+    "LABELS {\"Mobile App\", \"auto_loan\", \"Credit/Debit Card\", \"Loan\", \"Prizes\", \"Competition\", \"Customer Service\", \"Other\"}\n\n"
+    "GUIDANCE\n"
+    "- Text may be English or Arabic (or mixed).\n"
+    "- Emojis are sentiment clues (😍❤️👏😘🔥🌹👍🙏👌 often positive) but context dominates.\n"
+    "- Complaints about expensive/unreasonable prices → negative unless clearly negated.\n"
+    "- If meaning unclear → label = \"Other\".\n\n"
+    "When you see TEXT:, reply ONLY with the JSON object.\n"
+)
+
+COMBINED_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sentiment": {"type": "string", "enum": SENTIMENT_LABELS},
+        "sentiment_confidence": {"type": "number"},
+        "label": {"type": "string", "enum": COMMENT_LABELS},
+        "label_confidence": {"type": "number"},
+        "reason": {"type": "string"},
+    },
+    "required": ["sentiment", "sentiment_confidence", "label", "label_confidence", "reason"],
+}
+
+SENTIMENT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sentiment": {"type": "string", "enum": SENTIMENT_LABELS},
+        "confidence": {"type": "number"},
+        "reason": {"type": "string"},
+    },
+    "required": ["sentiment", "confidence", "reason"],
+}
+
+LABEL_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "label": {"type": "string", "enum": COMMENT_LABELS},
+        "confidence": {"type": "number"},
+        "reason": {"type": "string"},
+    },
+    "required": ["label", "confidence", "reason"],
+}
+
+# JSON schema enforced through Ollama's `format` in the "schema" and "labels" output modes
+RESPONSE_SCHEMAS = {
+    "sentiment": SENTIMENT_RESPONSE_SCHEMA,
+    "comment_classification": LABEL_RESPONSE_SCHEMA,
+    "post_classification": LABEL_RESPONSE_SCHEMA,
+    "combined": COMBINED_RESPONSE_SCHEMA,
+}
+
+# num_predict per classified text: room for a short reason, or for label + confidence only.
+# Batched requests get this much per item plus BATCH_TOKEN_OVERHEAD.
+RESPONSE_TOKEN_LIMITS = {"schema": 128, "labels": 48}
+BATCH_TOKEN_OVERHEAD = 16
+
+# Appended to the system prompt in the "labels" output mode
+LABELS_ONLY_INSTRUCTIONS = "\n\nLABELS ONLY\nLeave out the \"reason\" field; reply with the label(s) and confidence only.\n"
+
+OUTPUT_MODES = ("prompt", "schema", "labels")
+
+# Ollama model options shared by every task. Keep num_ctx identical across tasks:
+# a request with another context size makes Ollama reload the model.
+KEEP_ALIVE = "30m"
+MODEL_OPTIONS = {"num_ctx": 4096}
+
+# Task registry: each task's request body is serialized once (see ChatTask)
+TASKS = {
+    "sentiment": ChatTask("sentiment", SA_SYSTEM_PROMPT, MODEL_NAME,
+                          options=MODEL_OPTIONS, keep_alive=KEEP_ALIVE),
+    "comment_classification": ChatTask("comment_classification", COMMENTS_CLASSIFICATION_SYSTEM_PROMPT, MODEL_NAME,
+                                       options=MODEL_OPTIONS, keep_alive=KEEP_ALIVE),
+    "post_classification": ChatTask("post_classification", POSTS_CLASSIFICATION_SYSTEM_PROMPT, MODEL_NAME,
+                                    options=MODEL_OPTIONS, keep_alive=KEEP_ALIVE),
+    "combined": ChatTask("combined", COMBINED_SYSTEM_PROMPT, MODEL_NAME, response_format=COMBINED_RESPONSE_SCHEMA,
+                         options=MODEL_OPTIONS, keep_alive=KEEP_ALIVE),
+}
+# Answer field(s) parse_response reads for each task; an answer is only cached
+# when every one of them parses
+TASK_ANSWER_FIELDS = {
+    "sentiment": ("sentiment",),
+    "comment_classification": ("label",),
+    "post_classification": ("label",),
+    "combined": ("sentiment", "label"),
+    "post_topic": ("topic",),
+}
+
+# System prompt of classify_Posts_Topic, {Topics} is replaced by the list of topics
+POSTS_TOPIC_SYSTEM_PROMPT_TEMPLATE = """
+        You are a precise JSON generator.
+
+        TASK
+        Read the TEXT and classify it into exactly one topic. Output only one JSON object.
+
+        RULES
+        - Choose exactly one topic from the allowed list.
+        - If unsure, pick the closest valid topic.
+        - Text may be English, Arabic, or mixed.
+        - Output MUST be valid JSON.
+        - Output MUST start with '{{' and end with '}}'.
+        - Do NOT include markdown, code fences, or any explanation.
+        - Do NOT output any text before or after the JSON object.
 
+        TOPICS
+        {Topics}
+
+        FORMAT
+        Return exactly one JSON object with this schema:
+        {{
+        "topic": "<one topic only>",
+        "confidence": <number between 0 and 1>,
+        "reason": "<max 15 words>"
+        }}
+
+        IMPORTANT
+        - No ```json fences.
+        - No comments.
+        - No extra text.
+        - JSON only.
+        """
+
+# Answers worth retrying: rate limited by the proxy or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Timing/token fields of an Ollama /api/chat response kept by parse_response. They
+# describe the whole request: a batched item gets an even share of them, the label
+# half of a combined answer and answers served from the cache get none
+OLLAMA_TIMING_FIELDS = ["total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration"]
+
+# Appended to a task's system prompt when several comments are sent in one request
+BATCH_INSTRUCTIONS = (
+    "\n\nBATCH MODE\n"
+    "The user message is a JSON array of items {\"id\": <number>, \"text\": <TEXT>}.\n"
+    "Classify every item on its own using the rules above.\n"
+    "Reply ONLY with one JSON object {\"results\": [...]} holding one FORMAT object per item, "
+    "each with an extra \"id\" field copied from its item.\n"
+)
+
+
+class _ControlCharTable(dict):
+    """
+    str.translate table that deletes every character whose Unicode category
+    starts with 'C' (control, format, surrogate, private use, unassigned).
+
+    Entries are filled on first lookup, so the table only ever holds the
+    characters that actually appear in the data instead of all 0x110000 code points.
+    """
+
+    def __missing__(self, codepoint):
+        value = None if unicodedata.category(chr(codepoint))[0] == 'C' else codepoint
+        self[codepoint] = value
+        return value
+
+
+CONTROL_CHAR_TABLE = _ControlCharTable()
+
+
+# ---- Rule-based fast path: comments these rules can decide never reach the LLM ----
+# A rule takes the raw comment text and returns None (let the model decide) or a
+# dict {"sentiment", "label", "confidence", "reason"}. Rules run in order and the
+# first decision wins; pass your own list to Model_predictor(rules=...).
+
+POSITIVE_EMOJIS = {
+    "😍", "❤", "👏", "😘", "🔥", "🌹", "👍", "🙏", "👌", "😀", "😃", "😄", "😁", "😊", "🥰", "😻",
+    "💕", "💖", "💗", "💙", "💚", "💛", "💜", "🤍", "🖤", "♥", "🌷", "🌸", "💐", "🎉", "🎊", "💯", "✅",
+    "🤩", "😎", "🥳", "🙌", "💪", "⭐", "🌟", "✨", "😇", "🤗", "☺", "🙂", "😂", "🤣",
+}
+# neutral faces (😐, 😑) are in neither set: alone they go to the model
+NEGATIVE_EMOJIS = {
+    "😡", "😠", "🤬", "👎", "😤", "😞", "😔", "😢", "😭", "💔", "😒", "🙄", "😩", "😫", "🤮", "🤢",
+    "😖", "😣", "😟", "😕", "🙁", "☹", "❌", "🚫",
+}
+# skin tones and the emoji variation selector don't change polarity
+_EMOJI_MODIFIERS = str.maketrans("", "", "\ufe0f\U0001F3FB\U0001F3FC\U0001F3FD\U0001F3FE\U0001F3FF")
+
+
+def rule_mentions_only(text):
+    # "@friend @other" - people tagging each other
+    if MENTION_PATTERN.sub('', text).strip() == '' and '@' in text:
+        return {"sentiment": "Neutral", "label": "Other", "confidence": 0.95, "reason": "mentions only"}
+    return None
+
+
+def rule_url_only(text):
+    if URL_PATTERN.search(text) and URL_PATTERN.sub('', MENTION_PATTERN.sub('', text)).strip() == '':
+        return {"sentiment": "Neutral", "label": "Other", "confidence": 0.9, "reason": "link only"}
+    return None
+
+
+def rule_emoji_only(text):
+    # every emoji must be in the lexicon and all of them must agree
+    emojis = [item["emoji"].translate(_EMOJI_MODIFIERS) for item in emoji.emoji_list(text)]
+    if not emojis or SPECIAL_CHAR_PATTERN.sub('', emoji.replace_emoji(text, '')).strip() != '':
+        return None
+    positive = sum(e in POSITIVE_EMOJIS for e in emojis)
+    negative = sum(e in NEGATIVE_EMOJIS for e in emojis)
+    if positive == len(emojis):
+        return {"sentiment": "Positive", "label": "Other", "confidence": 0.85, "reason": "positive emojis only"}
+    if negative == len(emojis):
+        return {"sentiment": "Negative", "label": "Other", "confidence": 0.85, "reason": "negative emojis only"}
+    return None
+
+
+def rule_too_short(text):
+    # no emoji, no letter in any script and at most 3 digits: nothing for the model
+    # to work with ("bad" or "سيء" are short but polar, so they go to the model)
+    rest = WHITESPACE_PATTERN.sub('', SPECIAL_CHAR_PATTERN.sub('', text))
+    if emoji.emoji_count(text) == 0 and len(rest) <= 3 and not any(char.isalpha() for char in rest):
+        return {"sentiment": "Neutral", "label": "Other", "confidence": 0.6, "reason": "too short"}
+    return None
+
+
+DEFAULT_RULES = [rule_mentions_only, rule_url_only, rule_emoji_only, rule_too_short]
+
+
+class S3MultipartWriter:
+    """
+    Write-only file object that streams bytes to an S3 object.
+
+    Data is buffered until `part_size` bytes are available, then sent as one
+    multipart-upload part on a thread pool, so at most about
+    (max_concurrency + 1) * part_size bytes are held in memory. Objects smaller
+    than one part are sent with a single put_object on close(). It keeps its own
+    position for tell(), so pyarrow's ParquetWriter can write straight into it.
+    """
+
+    def __init__(self, s3_client, bucket_name, key, part_size=16 * 1024 * 1024, max_concurrency=4, content_type=None):
+        # S3 rejects parts under 5 MiB (except the last one)
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.max_concurrency = max_concurrency
+        self.content_type = content_type
+        self.closed = False
+
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id = None
+        self._futures = []
+        self._executor = None
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+        return len(data)
+
+    def _submit_part(self, body):
+        if self._upload_id is None:
+            extra = {"ContentType": self.content_type} if self.content_type else {}
+            self._upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, **extra
+            )["UploadId"]
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+        # wait for the oldest part when too many are in flight, to bound memory
+        in_flight = [f for f in self._futures if not f.done()]
+        if len(in_flight) >= self.max_concurrency:
+            in_flight[0].result()
+
+        part_number = len(self._futures) + 1
+        self._futures.append(self._executor.submit(
+            self.s3_client.upload_part,
+            Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+            PartNumber=part_number, Body=body,
+        ))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._upload_id is None:
+            extra = {"ContentType": self.content_type} if self.content_type else {}
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=self.key, Body=bytes(self._buffer), **extra)
+            return
+        try:
+            if self._buffer:
+                self._submit_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            parts = [
+                {"ETag": future.result()["ETag"], "PartNumber": number}
+                for number, future in enumerate(self._futures, start=1)
+            ]
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def abort(self):
+        """Drop the buffered data and cancel the multipart upload, if one was started."""
+        self.closed = True
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            # let parts already sending finish first: S3 keeps storing parts
+            # that land after the abort, and the pool threads would leak
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id)
+
+
+# urllib3 connection each thread has checked out of a Model_predictor session,
+# so another thread can abort the request (see _HedgedAttempt.cancel)
+_CHECKED_OUT_CONNECTIONS = {}
+
+
+class _TrackingPoolMixin:
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        _CHECKED_OUT_CONNECTIONS[threading.get_ident()] = conn
+        return conn
+
+    def _put_conn(self, conn):
+        _CHECKED_OUT_CONNECTIONS.pop(threading.get_ident(), None)
+        super()._put_conn(conn)
+
+
+class _TrackingHTTPConnectionPool(_TrackingPoolMixin, urllib3.HTTPConnectionPool):
+    pass
+
+
+class _TrackingHTTPSConnectionPool(_TrackingPoolMixin, urllib3.HTTPSConnectionPool):
+    pass
+
+
+class _TrackingHTTPAdapter(HTTPAdapter):
+    # HTTPAdapter whose pools record the connection in use by each thread
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackingHTTPConnectionPool,
+            "https": _TrackingHTTPSConnectionPool,
+        }
+
+
+class _HedgeCancelled(requests.RequestException):
+    """The other copy of a hedged request answered first."""
+
+
+class _HedgedAttempt:
+    """
+    Handle on one copy of a hedged request running on a _hedge_executor thread.
+    cancel() skips it if it hasn't started, or shuts its socket down so the
+    blocked read fails at once and the server stops generating.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.cancelled = False
+
+    def cancel(self, future):
+        self.cancelled = True
+        if future.cancel():
+            return
+        conn = _CHECKED_OUT_CONNECTIONS.get(self.thread) if self.thread is not None else None
+        sock = getattr(conn, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 
 class Model_predictor:
 
+    def __init__(self, max_workers=10, timeout=(5, 300), cache=None, rules=None, limiter=None, endpoints=None,
+                 max_retries=2, retry_backoff=0.5, deadline=None, hedge=False, hedge_min_samples=20, metrics=None,
+                 output_mode="prompt", num_predict=None):
+        """
+        :param max_workers: number of worker threads used by run_prediction; the
+                            HTTP connection pool is sized to match it.
+        :param timeout: requests timeout for every API call, either seconds or a
+                        (connect, read) tuple.
+        :param cache: optional PredictionCache; checked before every chat request
+                      and filled with every successful response.
+        :param rules: optional list of rule functions (e.g. DEFAULT_RULES) tried
+                      before the model; see rule_mentions_only.
+        :param limiter: optional AIMDConcurrencyLimiter; every chat request takes
+                        one of its slots, so the number of in-flight requests adapts
+                        to latency and 429/5xx answers. With a limiter the "threads"
+                        engine and the connection pool use limiter.max_limit workers.
+        :param endpoints: optional EndpointPool; requests made without an explicit
+                          url are routed to its least loaded healthy endpoint
+                          instead of DEFAULT_CHAT_URL.
+        :param max_retries: retries of a chat request after a connection error,
+                            timeout or a RETRY_STATUSES answer.
+        :param retry_backoff: base of the exponential backoff; the wait before retry n
+                              is uniform in [0, retry_backoff * 2**n] (full jitter).
+        :param deadline: optional seconds a chat call may take in total, retries
+                         included; no new attempt starts after it and every
+                         attempt's timeout is cut to the time left.
+        :param hedge: if True, a request still unanswered after the p95 of recent
+                      latencies is sent a second time and the first answer wins.
+        :param hedge_min_samples: latencies needed before hedging starts.
+        :param metrics: optional RequestMetrics recording the wall time, server-side
+                        prompt/decode time and tokens/sec of every chat request.
+        :param output_mode: "prompt" only describes the answer format in the prompt;
+                            "schema" also enforces RESPONSE_SCHEMAS through Ollama's
+                            `format` and caps the answer at num_predict tokens;
+                            "labels" does the same without the free-text reason,
+                            for the fewest decoded tokens per comment.
+        :param num_predict: per-text token cap of the "schema"/"labels" modes
+                            (default RESPONSE_TOKEN_LIMITS).
+        """
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output_mode '{output_mode}', expected one of {OUTPUT_MODES}")
+        self.limiter = limiter
+        self.endpoints = endpoints
+        if limiter is not None:
+            max_workers = max(max_workers, limiter.max_limit)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = cache
+        self.rules = list(rules) if rules else []
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.metrics = metrics
+        self.output_mode = output_mode
+        self.num_predict = num_predict
+        self.batch_requests = 0
+        self.batch_fallbacks = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = {}  # task -> deque of recent latencies
+        self._tasks = {}
+        self._batch_tasks = {}
+        self._topic_tasks = {}
+        self._hedge_executor = None
+        self._stats_lock = threading.Lock()
+        self._s3_clients = {}
+        # hedged requests can double the number of open connections
+        self.session = self._build_session(max_workers * 2 if hedge else max_workers)
+
+    def _build_session(self, pool_size):
+        # One keep-alive session shared by all worker threads, so each thread
+        # reuses its connection instead of opening a new TCP connection per comment
+        session = requests.Session()
+        hosts = len(self.endpoints.urls) if self.endpoints is not None else 1
+        adapter = _TrackingHTTPAdapter(pool_connections=max(4, hosts), pool_maxsize=pool_size, pool_block=True)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     def remove_urls(self,text):
         # Remove URLs using regex
-        url_pattern = re.compile(r'https?://\S+|www\.\S+')
-        text= url_pattern.sub(r'', text)
-        return text
+        return URL_PATTERN.sub(r'', text)
 
     def has_more_than_five_chars_excluding_spaces(self,text):
         """
@@ -42,19 +552,16 @@ class Model_predictor:
         try:
             # return re.sub(r'@\w+', '', text).strip()
             # Regular expression to match mentions
-            mention_pattern = r'@[\w\.\-_]+'
             # Substitute mentions with an empty string
-            cleaned_comment = re.sub(mention_pattern, '', text)
-            # cleaned_comment = re.sub(".", '', text)
+            cleaned_comment = MENTION_PATTERN.sub('', text)
             # Remove extra spaces left after removing mentions
-            return re.sub(r'\s+', ' ', cleaned_comment).strip()
+            return WHITESPACE_PATTERN.sub(' ', cleaned_comment).strip()
         except:
             print(text)
 
     def remove_special_characters(self,text):
         # Remove special characters using regex
-        special_char_pattern = re.compile(r'[^\w\s\u0621-\u064A]+', re.UNICODE)
-        return special_char_pattern.sub(r'', text)
+        return SPECIAL_CHAR_PATTERN.sub(r'', text)
 
     def convert_emojis(self,text):
         # Convert emojis to human-readable text
@@ -62,7 +569,7 @@ class Model_predictor:
 
     def normalize_unicode(self,text):
         # Normalize Unicode characters to remove control characters
-        return ''.join(ch for ch in text if unicodedata.category(ch)[0] != 'C')
+        return text.translate(CONTROL_CHAR_TABLE)
 
     def remove_end_of_lines(self,text):
         """
@@ -86,49 +593,590 @@ class Model_predictor:
         # Remove end of lines
         text = self.remove_end_of_lines(text)
         # Remove extra spaces
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = WHITESPACE_PATTERN.sub(' ', text).strip()
         return text
 
+    def clean_series(self, series):
+        """
+        Batch version of clean_text for a whole pandas Series.
+
+        Duplicate comments are very common, so the Series is factorized first
+        and every unique text goes through clean_text only once, then is
+        scattered back to all rows. Missing values stay missing.
+
+        Args:
+            series (pd.Series): Comment texts.
+
+        Returns:
+            pd.Series: Cleaned texts with the same index, name and dtype,
+            equal to series.apply(clean_text) for every non-missing value.
+        """
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        cleaned = np.array([self.clean_text(text) for text in uniques], dtype=object)
+        values = cleaned.take(codes) if len(cleaned) else np.full(len(codes), None, dtype=object)
+        values[codes == -1] = None
+        return pd.Series(values, index=series.index, name=series.name, dtype=object).astype(series.dtype)
+
     def is_nan(self,x):
         try:
             return np.isnan(float(x)) 
         except ValueError:
             return False
 
-    def process_row(self,row , processCol):
+    def process_row(self,row , processCol, task_mode="separate"):
+        if task_mode == "combined":
+            sa, com = self.split_combined_response(self.model_predict_combined_api(row[processCol]))
+            return {"Comment_pk": row["Comment_pk"], "SA": sa}, {"Comment_pk": row["Comment_pk"], "SA": com}
         return (
             {"Comment_pk": row["Comment_pk"], "SA": self.model_predict_SA_api(row[processCol])},
             {"Comment_pk": row["Comment_pk"], "SA": self.model_predict_comments_classification_api(row[processCol])},
         )
 
-    def run_prediction(self,df , processCol, save_Folder_Path, save_Folder_model_topic_Path):
-        predicted_SA = []
-        predicted_comments = []
+    def make_batches(self, items, batch_size, batch_max_tokens=2000):
+        """
+        Greedily pack (key, text) pairs into batches of at most `batch_size` items
+        whose estimated token count stays under `batch_max_tokens`. A single text
+        over the budget still gets a batch of its own.
+        """
+        batch = []
+        batch_tokens = 0
+        for key, text in items:
+            tokens = self._estimate_tokens(text)
+            if batch and (len(batch) >= batch_size or batch_tokens + tokens > batch_max_tokens):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append((key, text))
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def _estimate_tokens(self, text):
+        # rough upper bound for Arabic/English text, plus the JSON wrapping of one item
+        return len(str(text)) // 3 + 10
+
+    def process_batch(self, batch, task_mode="separate"):
+        """
+        Classify a list of (key, text) pairs, packing all texts of the batch
+        into one request per task.
+
+        Returns:
+            list: (key, (SA result, comments classification result)) per item,
+                  the same results process_row gives for a single comment.
+        """
+        if len(batch) == 1:
+            key, text = batch[0]
+            return [(key, self.process_row({"Comment_pk": key, "text": text}, "text", task_mode))]
+
+        texts = [text for _, text in batch]
+        if task_mode == "combined":
+            responses = self._post_chat_batch(self._task("combined"), texts)
+            pairs = [self.split_combined_response(response_text) for response_text in responses]
+        else:
+            pairs = zip(self._post_chat_batch(self._task("sentiment"), texts),
+                        self._post_chat_batch(self._task("comment_classification"), texts))
+        return [
+            (key, ({"Comment_pk": key, "SA": sa}, {"Comment_pk": key, "SA": com}))
+            for (key, _), (sa, com) in zip(batch, pairs)
+        ]
+
+    async def process_batch_async(self, http, batch, url=None, task_mode="separate"):
+        # async counterpart of process_batch
+        if len(batch) == 1:
+            key, text = batch[0]
+            return [(key, await self.process_row_async(http, key, text, url, task_mode))]
+
+        texts = [text for _, text in batch]
+        if task_mode == "combined":
+            responses = await self._post_chat_batch_async(http, self._task("combined"), texts, url)
+            pairs = [self.split_combined_response(response_text) for response_text in responses]
+        else:
+            pairs = zip(await self._post_chat_batch_async(http, self._task("sentiment"), texts, url),
+                        await self._post_chat_batch_async(http, self._task("comment_classification"), texts, url))
+        return [
+            (key, ({"Comment_pk": key, "SA": sa}, {"Comment_pk": key, "SA": com}))
+            for (key, _), (sa, com) in zip(batch, pairs)
+        ]
+
+    async def _post_chat_async(self, http, task, text, url=None):
+        # async counterpart of _post_chat
+        key = self._cache_key(task, text)
+        if key is not None:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+        import aiohttp
+
+        try:
+            ok, response_text = await self._send_async(http, url, task.payload(text), task.name)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return self._failed_response(e)
+        if key is not None and ok and self._answer_parses(task, response_text):
+            self.cache.put(key, response_text)
+        return response_text
+
+    async def process_row_async(self, http, comment_pk, text, url=None, task_mode="separate"):
+        # async counterpart of process_row, both calls share the caller's semaphore slot
+        if task_mode == "combined":
+            response_text = await self._post_chat_async(http, self._task("combined"), text, url)
+            sa, com = self.split_combined_response(response_text)
+            return {"Comment_pk": comment_pk, "SA": sa}, {"Comment_pk": comment_pk, "SA": com}
+        sa = await self._post_chat_async(http, self._task("sentiment"), text, url)
+        com = await self._post_chat_async(http, self._task("comment_classification"), text, url)
+        return {"Comment_pk": comment_pk, "SA": sa}, {"Comment_pk": comment_pk, "SA": com}
+
+    async def _run_batches_async(self, batches, total, max_in_flight, worker):
+        """
+        Run `await worker(http, batch)` for every batch of (key, text) pairs on one
+        event loop; the worker returns a list of (key, result).
+
+        At most `max_in_flight` batches are in flight at any time; a new task is only
+        created once a slot frees up, so memory does not grow with the input size.
+
+        Returns:
+            dict: key -> result
+        """
+        import aiohttp
+
+        if isinstance(self.timeout, tuple):
+            timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+        else:
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        semaphore = asyncio.BoundedSemaphore(max_in_flight)
+        results = {}
+        errors = []
+        pending = set()
+
+        connector = aiohttp.TCPConnector(limit=max_in_flight)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+            with tqdm(total=total) as progress:
+
+                async def run_one(batch):
+                    try:
+                        results.update(await worker(http, batch))
+                    except Exception as e:
+                        errors.append(e)
+                    finally:
+                        semaphore.release()
+                        if self.limiter is not None:
+                            progress.set_postfix(limit=self.limiter.current_limit, refresh=False)
+                        progress.update(len(batch))
+
+                for batch in batches:
+                    if errors:
+                        break
+                    await semaphore.acquire()
+                    task = asyncio.create_task(run_one(batch))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+                if pending:
+                    await asyncio.gather(*pending)
+
+        if errors:
+            raise errors[0]
+        return results
+
+    def rule_decision_key(self, text):
+        """
+        Hashable summary of what self.rules decide for `text` (rule name and
+        decision), or "model" when no rule applies.
+        """
+        for rule in self.rules:
+            decision = rule(str(text))
+            if decision is not None:
+                return rule.__name__ + repr(sorted(decision.items()))
+        return "model"
+
+    def apply_rules(self, items):
+        """
+        Run self.rules over (key, text) pairs.
+
+        Returns:
+            tuple: (results, paths) where results maps every decided key to
+                   (SA result, comments classification result) shaped like a
+                   model response, and paths maps it to "rule:<rule name>"
+                   (e.g. "rule:mentions_only" for rule_mentions_only).
+        """
+        results = {}
+        paths = {}
+        for key, text in items:
+            for rule in self.rules:
+                decision = rule(str(text))
+                if decision is None:
+                    continue
+                base = {"model": "rules", "message": {"role": "assistant", "content": ""}, "done": True}
+                sa = {"sentiment": decision["sentiment"], "confidence": decision["confidence"], "reason": decision["reason"]}
+                com = {"label": decision["label"], "confidence": decision["confidence"], "reason": decision["reason"]}
+                results[key] = (
+                    {"Comment_pk": key, "SA": self._with_message_content(base, sa)},
+                    {"Comment_pk": key, "SA": self._with_message_content(base, com)},
+                )
+                paths[key] = "rule:" + rule.__name__.removeprefix("rule_")
+                break
+        return results, paths
+
+    def _predict_items(self, items, engine="threads", max_in_flight=1000, task_mode="separate", batch_size=None, batch_max_tokens=2000):
+        """
+        Classify a list of (key, text) pairs with the chosen engine, one comment
+        per request or `batch_size` comments per request.
+
+        Returns:
+            dict: key -> (SA result, comments classification result)
+        """
+        if batch_size:
+            batches = self.make_batches(items, batch_size, batch_max_tokens)
+        else:
+            batches = ([item] for item in items)
+
+        results = self._run_batches(
+            batches, len(items), engine, max_in_flight,
+            lambda batch: self.process_batch(batch, task_mode),
+            lambda http, batch: self.process_batch_async(http, batch, task_mode=task_mode),
+        )
+
+        if batch_size:
+            print(f"Batching: {self.batch_requests:,} batched requests, {self.batch_fallbacks:,} per-item fallbacks")
+        self._print_run_stats()
+        return results
+
+    def _run_batches(self, batches, total, engine, max_in_flight, worker, worker_async):
+        """
+        Fan batches of (key, text) pairs out with the chosen engine: worker(batch)
+        on self.max_workers threads, or worker_async(http, batch) with up to
+        `max_in_flight` batches in flight on one event loop. Both return a list
+        of (key, result) per batch.
+
+        Returns:
+            dict: key -> result
+        """
+        if engine == "async":
+            return asyncio.run(self._run_batches_async(batches, total, max_in_flight, worker_async))
+        if engine != "threads":
+            raise ValueError(f"Unknown engine '{engine}', expected 'threads' or 'async'")
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex, tqdm(total=total) as progress:
+            for batch_results in ex.map(worker, batches):
+                results.update(batch_results)
+                if self.limiter is not None:
+                    progress.set_postfix(limit=self.limiter.current_limit, refresh=False)
+                progress.update(len(batch_results))
+        return results
+
+    def _print_run_stats(self):
+        if self.limiter is not None:
+            print(f"Concurrency: {self.limiter.stats()}")
+        if self.endpoints is not None:
+            print(f"Endpoints: {self.endpoints.stats()}")
+        print(f"Requests: {self.retries:,} retries, {self.failures:,} failed, "
+              f"{self.hedges:,} hedged ({self.hedge_wins:,} won by the hedge)")
+        if self.metrics is not None:
+            print(self.metrics.format_summary())
+
+    def _predict_frame(self, df, processCol, engine="threads", max_in_flight=1000, task_mode="separate", dedup=True, batch_size=None, batch_max_tokens=2000, keep_raw_responses=False):
+        """
+        Classify the rows of `df` and return it with the typed prediction columns
+        of parse_responses added (sentiment, sentiment_confidence, ..., label,
+        label_confidence, ...) plus decision_path. With keep_raw_responses the raw
+        SA_prediction and comments_classification_prediction columns are kept too.
+        """
+        texts = df[processCol].tolist()
+
+        if dedup:
+            codes, _ = pd.factorize(self.clean_series(df[processCol]), use_na_sentinel=False)
+            if self.rules and texts:
+                # rules look at the raw text and cleaning maps e.g. a link and "!!!"
+                # to the same "", so rows only share a group if the rules agree too
+                raw_codes, raw_texts = pd.factorize(df[processCol], use_na_sentinel=False)
+                decision_codes, _ = pd.factorize(pd.Series([self.rule_decision_key(text) for text in raw_texts], dtype=object),
+                                                 use_na_sentinel=False)
+                codes, _ = pd.factorize(codes.astype(np.int64) * (decision_codes.max() + 1) + decision_codes[raw_codes],
+                                        use_na_sentinel=False)
+            _, first_rows = np.unique(codes, return_index=True)
+            items = [(group, texts[row]) for group, row in enumerate(first_rows)]
+            if texts:
+                print(f"Dedup: {len(items):,} unique texts for {len(texts):,} rows "
+                      f"(dedup ratio {1 - len(items) / len(texts):.1%})")
+        else:
+            codes = range(len(texts))
+            items = list(enumerate(texts))
+
+        results, paths = self.apply_rules(items)
+        model_items = [(key, text) for key, text in items if key not in results]
+        if self.rules and items:
+            print(f"Rules: {len(items) - len(model_items):,} of {len(items):,} texts decided without the model")
+        results.update(self._predict_items(model_items, engine, max_in_flight, task_mode, batch_size, batch_max_tokens))
+
+        df = df.copy()
+        df["decision_path"] = [paths.get(code, "model") for code in codes]
+
+        # parse once per unique text, then scatter to the rows with an arrow take
+        row_codes = pa.array(codes, type=pa.int64())
+        for position, field in ((0, "sentiment"), (1, "label")):
+            parsed = self.parse_responses([results[key][position]["SA"] for key, _ in items], field).take(row_codes)
+            for name in parsed.column_names:
+                column = field if name == field else f"{field}_{name}"
+                df[column] = parsed.column(name).to_pandas(types_mapper=pd.ArrowDtype).array
+
+        if keep_raw_responses:
+            ordered = [results[code] for code in codes]
+            df["SA_prediction"] = [
+                {"Comment_pk": comment_pk, "SA": sa_res["SA"]} for comment_pk, (sa_res, _) in zip(df["Comment_pk"], ordered)
+            ]
+            df["comments_classification_prediction"] = [
+                {"Comment_pk": comment_pk, "SA": com_res["SA"]} for comment_pk, (_, com_res) in zip(df["Comment_pk"], ordered)
+            ]
+        return df
+
+    def _read_manifest(self, shard_folder, repair=False):
+        """
+        Read the shard manifest written by run_prediction(shard_size=...).
+
+        Args:
+            repair (bool): cut a partially written last line (crash while
+                appending) off the file, so the next entry starts on its own line.
+
+        Returns:
+            list: one {"shard": file name, "Comment_pk": [...]} dict per finished shard.
+                  A partially written last line is ignored.
+        """
+        manifest_path = os.path.join(shard_folder, "manifest.jsonl")
+        entries = []
+        if not os.path.exists(manifest_path):
+            return entries
+        valid_bytes = 0
+        with open(manifest_path, "rb") as f:
+            for line in f:
+                # an entry only counts once its newline is on disk
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+            torn = f.seek(0, os.SEEK_END) > valid_bytes
+        if repair and torn:
+            print(f"Manifest: dropping a partially written entry at byte {valid_bytes:,}")
+            with open(manifest_path, "r+b") as f:
+                f.truncate(valid_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+        return entries
+
+    def _write_shard(self, shard_folder, shard_index, df):
+        # write to a temp name and rename, then record the shard in the manifest;
+        # a crash at any point leaves only complete shards listed in the manifest
+        shard_name = f"part-{shard_index:05d}.parquet"
+        tmp_path = os.path.join(shard_folder, shard_name + ".tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(shard_folder, shard_name))
+
+        with open(os.path.join(shard_folder, "manifest.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"shard": shard_name, "Comment_pk": df["Comment_pk"].tolist()}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run_prediction(self,df , processCol, save_Folder_Path, save_Folder_model_topic_Path, engine="threads", max_in_flight=1000, task_mode="separate", dedup=True, shard_size=None, resume=False, batch_size=None, batch_max_tokens=2000, keep_raw_responses=False, output_format="csv"):
+        """
+        Classify every non-empty comment (sentiment + comment classification) and
+        save the results to <save_Folder_Path>/<save_Folder_model_topic_Path>/predicted_analysis.csv
+        (or .parquet).
+
+        Args:
+            engine (str): "threads" fans out over a ThreadPoolExecutor with
+                self.max_workers threads; "async" runs up to `max_in_flight`
+                concurrent requests on a single asyncio event loop (needs aiohttp).
+            max_in_flight (int): concurrency limit for the "async" engine.
+            task_mode (str): "separate" sends one sentiment and one classification
+                request per comment; "combined" asks for both in a single request
+                and splits the answer back into the same two columns.
+            dedup (bool): group rows whose clean_text is identical, classify the
+                first comment of each group once and copy the result to every
+                Comment_pk in the group.
+            shard_size (int): if set, rows are processed `shard_size` at a time and
+                every finished chunk is written to shards/part-NNNNN.parquet and
+                recorded in shards/manifest.jsonl before the next one starts, so
+                only one chunk of results is held in memory. Dedup then works per
+                chunk; use a PredictionCache to also share answers across chunks.
+            resume (bool): with shard_size, keep the existing shards and skip every
+                Comment_pk already listed in the manifest. Without resume the
+                shards of a previous run are removed first.
+            batch_size (int): if set, pack up to `batch_size` comments (and at most
+                `batch_max_tokens` estimated tokens of text) into one request per
+                task; items missing from the model's JSON answer are retried one
+                by one.
+            keep_raw_responses (bool): also keep the raw response text in the
+                SA_prediction and comments_classification_prediction columns;
+                by default only the typed columns of parse_responses are saved.
+            output_format (str): "csv" or "parquet".
+        """
         df = df[df[processCol] != ""]
-        rows = [row for _, row in df.iterrows()]
 
+        if shard_size is None:
+            df = self._predict_frame(df, processCol, engine, max_in_flight, task_mode, dedup, batch_size, batch_max_tokens, keep_raw_responses)
+            if self.cache is not None:
+                print(f"Prediction cache: {self.cache.stats()}")
+            # save the results
+            output_folder = os.path.join(save_Folder_Path , save_Folder_model_topic_Path)
+            if not os.path.exists(output_folder):
+                os.makedirs(output_folder)
+            if output_format == "parquet":
+                df.to_parquet(os.path.join(output_folder , "predicted_analysis.parquet") , index=False)
+            else:
+                df.to_csv(os.path.join(output_folder , "predicted_analysis.csv") , index=False)
+            return
+
+        chunks = (df.iloc[start:start + shard_size] for start in range(0, len(df), shard_size))
+        self.run_prediction_stream(
+            chunks, processCol, save_Folder_Path, save_Folder_model_topic_Path, resume=resume, output_format=output_format,
+            engine=engine, max_in_flight=max_in_flight, task_mode=task_mode, dedup=dedup,
+            batch_size=batch_size, batch_max_tokens=batch_max_tokens, keep_raw_responses=keep_raw_responses,
+        )
+
+    def run_prediction_stream(self, chunks, processCol, save_Folder_Path, save_Folder_model_topic_Path, resume=False, output_format="csv", **options):
+        """
+        Classify comments arriving as an iterable of DataFrames (e.g. from
+        read_comments_in_chunks), writing every chunk's results to a Parquet
+        shard before the next chunk is read. Peak memory depends on the chunk
+        size, not on the size of the input.
 
-        with ThreadPoolExecutor(max_workers=10) as ex:
-            for sa_res, com_res in tqdm(ex.map(self.process_row, rows, [processCol]*len(rows)), total=len(rows)):
-               
+        Args:
+            chunks: iterable of DataFrames with a Comment_pk and a `processCol` column.
+            resume (bool): keep the existing shards and skip every Comment_pk already
+                listed in shards/manifest.jsonl. Without resume the shards of a
+                previous run are removed first.
+            output_format (str): "csv" or "parquet" for the assembled output file.
+            **options: engine, max_in_flight, task_mode, dedup, batch_size,
+                batch_max_tokens and keep_raw_responses, as in run_prediction.
+
+        Returns:
+            str: path of the predicted_analysis.csv / .parquet assembled from all shards.
+        """
+        output_folder = os.path.join(save_Folder_Path , save_Folder_model_topic_Path)
+        shard_folder = os.path.join(output_folder, "shards")
+        if not os.path.exists(shard_folder):
+            os.makedirs(shard_folder)
+        if not resume:
+            for name in os.listdir(shard_folder):
+                if name.startswith("part-") or name == "manifest.jsonl":
+                    os.remove(os.path.join(shard_folder, name))
+
+        manifest = self._read_manifest(shard_folder, repair=True)
+        done = {comment_pk for entry in manifest for comment_pk in entry["Comment_pk"]}
+        if done:
+            print(f"Resuming: {len(done):,} comments already done")
+
+        shard_index = max((int(name[5:10]) for name in os.listdir(shard_folder) if name.startswith("part-")), default=0)
+        for chunk in chunks:
+            chunk = chunk[chunk[processCol] != ""]
+            if done:
+                chunk = chunk[~chunk["Comment_pk"].isin(done)]
+            if len(chunk) == 0:
+                continue
+            shard_index += 1
+            self._write_shard(shard_folder, shard_index, self._predict_frame(chunk, processCol, **options))
+        if self.cache is not None:
+            print(f"Prediction cache: {self.cache.stats()}")
+
+        # stream the finished shards into the output file one at a time
+        shard_paths = [os.path.join(shard_folder, entry["shard"]) for entry in self._read_manifest(shard_folder)]
+        if output_format == "parquet":
+            output_path = os.path.join(output_folder , "predicted_analysis.parquet")
+            writer = None
+            for shard_path in shard_paths:
+                table = pq.read_table(shard_path)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            if writer is not None:
+                writer.close()
+        else:
+            output_path = os.path.join(output_folder , "predicted_analysis.csv")
+            header = True
+            with open(output_path, "w", encoding="utf-8", newline="") as f:
+                for shard_path in shard_paths:
+                    pd.read_parquet(shard_path).to_csv(f, index=False, header=header)
+                    header = False
+        return output_path
+
+    def read_comments_in_chunks(self, path, columns=("Comment_pk", "Comment_text"), chunk_rows=50_000):
+        """
+        Yield the input file as DataFrames of at most `chunk_rows` rows holding only
+        `columns`, all as strings. Parquet files are read batch by batch with
+        pyarrow, anything else is read as CSV with pandas' chunked reader.
+
+        :param path: .parquet or .csv file.
+        :param columns: columns to keep; the others are never materialized.
+        :param chunk_rows: rows per yielded DataFrame.
+        """
+        columns = list(columns)
+        if path.endswith(".parquet"):
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+                table = pa.Table.from_batches([batch])
+                table = table.cast(pa.schema([(name, pa.string()) for name in table.column_names]))
+                yield table.to_pandas().fillna("")
+        else:
+            yield from pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+
+    def save_file_to_s3(self, path, bucket_name, key, aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None, region_name=None,
+                        part_size_mb=16, max_concurrency=4, endpoint_url=None):
+        """
+        Upload a local file to S3. boto3 streams it from disk in multipart parts
+        uploaded in parallel, so the file is never loaded into memory.
+
+        Returns:
+        - dict: {"success": True, "bucket": bucket_name, "key": key} on success
+                {"success": False, "error": "<message>"} on failure
+        """
+        try:
+            s3_client = self.get_s3_client(aws_access_key_id, aws_secret_access_key, aws_session_token, region_name, endpoint_url)
+            config = TransferConfig(
+                multipart_chunksize=part_size_mb * 1024 * 1024,
+                max_concurrency=max_concurrency,
+            )
+            s3_client.upload_file(path, bucket_name, key, Config=config)
+            return {"success": True, "bucket": bucket_name, "key": key}
+        except (BotoCoreError, ClientError, Exception) as e:
+            return {"success": False, "error": str(e)}
 
+    def get_s3_client(self, aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None, region_name=None, endpoint_url=None):
+        """
+        Return an S3 client for the given credentials, creating the boto3 session
+        and client only on the first call; later calls reuse the same client.
 
-        with ThreadPoolExecutor(max_workers=10) as ex:
-            for sa_res, com_res in tqdm(ex.map(self.process_row, rows, [processCol]*len(rows)), total=len(rows)):
-                predicted_SA.append(sa_res)
-                predicted_comments.append(com_res)
-            
-        df["SA_prediction"] = predicted_SA
-        df["comments_classification_prediction"] = predicted_comments
-        # save the results
-        if not os.path.exists(os.path.join(save_Folder_Path , save_Folder_model_topic_Path)):
-            os.makedirs(os.path.join(save_Folder_Path , save_Folder_model_topic_Path))  
-        df.to_csv(os.path.join(save_Folder_Path , save_Folder_model_topic_Path , "predicted_analysis.csv") , index=False) 
+        :param endpoint_url: optional S3-compatible endpoint, e.g. a local moto server.
+        """
+        cache_key = (aws_access_key_id, aws_secret_access_key, aws_session_token, region_name, endpoint_url)
+        with self._stats_lock:
+            s3_client = self._s3_clients.get(cache_key)
+            if s3_client is None:
+                session_kwargs = {}
+                if aws_access_key_id and aws_secret_access_key:
+                    session_kwargs["aws_access_key_id"] = aws_access_key_id
+                    session_kwargs["aws_secret_access_key"] = aws_secret_access_key
+                    if aws_session_token:
+                        session_kwargs["aws_session_token"] = aws_session_token
+                if region_name:
+                    session_kwargs["region_name"] = region_name
+
+                session = boto3.Session(**session_kwargs) if session_kwargs else boto3.Session()
+                client_kwargs = {"endpoint_url": endpoint_url} if endpoint_url else {}
+                s3_client = session.client("s3", **client_kwargs)
+                self._s3_clients[cache_key] = s3_client
+            return s3_client
 
     #save dataframe in s3
-    def save_df_to_s3(self, df, bucket_name, key, aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None, region_name=None):
+    def save_df_to_s3(self, df, bucket_name, key, aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None, region_name=None,
+                      file_format=None, compression="zstd", chunk_rows=100_000, part_size_mb=16, max_concurrency=4, endpoint_url=None):
         """
-        Save a pandas DataFrame to S3 as a CSV.
+        Save a pandas DataFrame to S3 as a CSV or Parquet file.
+
+        The frame is serialized `chunk_rows` rows at a time straight into a
+        multipart upload (S3MultipartWriter), so no full copy of the file is
+        ever built in memory and parts are uploaded in parallel.
 
         Parameters:
         - df: pandas.DataFrame to save
@@ -136,31 +1184,48 @@ class Model_predictor:
         - key: S3 object key, e.g. "folder/filename.csv" (str)
         - aws_access_key_id, aws_secret_access_key, aws_session_token: optional AWS creds (str)
         - region_name: optional AWS region (str)
+        - file_format: "csv" or "parquet"; by default taken from the key's extension (csv otherwise)
+        - compression: Parquet codec, e.g. "zstd" or "snappy" (ignored for CSV)
+        - chunk_rows: rows serialized per step
+        - part_size_mb: size of each multipart part (min 5)
+        - max_concurrency: parts uploaded in parallel
+        - endpoint_url: optional S3-compatible endpoint (e.g. moto server for testing)
 
         Returns:
         - dict: {"success": True, "bucket": bucket_name, "key": key} on success
                 {"success": False, "error": "<message>"} on failure
         """
+        if file_format is None:
+            file_format = "parquet" if key.endswith(".parquet") else "csv"
+        writer = None
         try:
-
-            csv_buffer = io.StringIO()
-            df.to_csv(csv_buffer, index=False)
-
-            session_kwargs = {}
-            if aws_access_key_id and aws_secret_access_key:
-                session_kwargs["aws_access_key_id"] = aws_access_key_id
-                session_kwargs["aws_secret_access_key"] = aws_secret_access_key
-                if aws_session_token:
-                    session_kwargs["aws_session_token"] = aws_session_token
-            if region_name:
-                session_kwargs["region_name"] = region_name
-
-            session = boto3.Session(**session_kwargs) if session_kwargs else boto3.Session()
-            s3_client = session.client("s3")
-
-            s3_client.put_object(Bucket=bucket_name, Key=key, Body=csv_buffer.getvalue(), ContentType="text/csv")
+            s3_client = self.get_s3_client(aws_access_key_id, aws_secret_access_key, aws_session_token, region_name, endpoint_url)
+            writer = S3MultipartWriter(
+                s3_client, bucket_name, key,
+                part_size=part_size_mb * 1024 * 1024,
+                max_concurrency=max_concurrency,
+                content_type="application/vnd.apache.parquet" if file_format == "parquet" else "text/csv",
+            )
+
+            if file_format == "parquet":
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                with pq.ParquetWriter(pa.PythonFile(writer, mode="w"), schema, compression=compression) as parquet_writer:
+                    for start in range(0, len(df), chunk_rows):
+                        chunk = pa.Table.from_pandas(df.iloc[start:start + chunk_rows], schema=schema, preserve_index=False)
+                        parquet_writer.write_table(chunk)
+            else:
+                writer.write(df.iloc[:0].to_csv(index=False))
+                for start in range(0, len(df), chunk_rows):
+                    writer.write(df.iloc[start:start + chunk_rows].to_csv(index=False, header=False))
+
+            writer.close()
             return {"success": True, "bucket": bucket_name, "key": key}
         except (BotoCoreError, ClientError, Exception) as e:
+            if writer is not None and not writer.closed:
+                try:
+                    writer.abort()
+                except (BotoCoreError, ClientError):
+                    pass
             return {"success": False, "error": str(e)}
     
     # Assuming remove_mentions function is already defined
@@ -180,133 +1245,752 @@ class Model_predictor:
         df['is_mentions_only'] = df[comment_column].apply(lambda x: self.remove_mentions(x) == '')
         return df
  
-    def model_predict_SA_api(self, text , url = "http://localhost:5000/v1/api/chat"):
-        # text = "أغسطس ٢٠٢٣ ، هادي المجمع والحركة فيه خفيفة رغم أني زرته بعد المغرب ، الخيارات للتسوق ليست كثيرة أعجبني فيه مقهى نصيف القريب من بوابة ٦ و ٧"
-        payload = json.dumps({
-        "model": "yasserrmd/ALLaM-7B-Instruct-preview",
-        "messages": [
-            {
-            "role": "system",
-            "content": "You are a precise sentiment classifier.\n\nTASK Classify the TEXT into exactly one label from LABELS.\n\nRULES\n\nChoose the single best label (no ties).\nPrefer \"Neutral\" if ambiguous (only if present).\nConsider negation, sarcasm, contrast.\nOutput MUST be one JSON object. No extra text.\nFORMAT { \"sentiment\": \"<one of the labels>\", \"confidence\": <0..1>, \"reason\": \"<max 20 words>\" }\n\nLABELS{Positive, Neutral, Negative}\n\nGUIDANCE\n\nText may be English or Arabic (or mixed).\nEmojis are sentiment clues (😍❤️👏😘🔥🌹👍🙏👌 often positive) but context dominates.\nComplaints about expensive/unreasonable prices → negative unless clearly negated.\n When you see TEXT:, classify it using the rules above. Respond ONLY with the JSON object and nothing else.\nTEXT"
-            },
-            {
-            "role": "user",
-            "content": f"TEXT:{text}"
-            }
-        ],
-        "stream": False
-        })
-        headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer demo'
-        }
-        response = requests.request("POST", url, headers=headers, data=payload)
-        # print(response.text)
-        return response.text
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _record_latency(self, task, latency):
+        with self._stats_lock:
+            if task not in self._latencies:
+                self._latencies[task] = deque(maxlen=1000)
+            self._latencies[task].append(latency)
+
+    def _hedge_delay(self, task):
+        # p95 of the recent successful latencies of `task` (a batch or a post topic
+        # takes longer than one sentiment call), None until there are enough samples
+        if not self.hedge:
+            return None
+        with self._stats_lock:
+            latencies = self._latencies.get(task, ())
+            if len(latencies) < self.hedge_min_samples:
+                return None
+            latencies = sorted(latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def _retry_delay(self, attempt, deadline_at):
+        delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+        if deadline_at is not None:
+            delay = min(delay, max(0.0, deadline_at - time.monotonic()))
+        return delay
+
+    def _may_retry(self, attempt, delay, deadline_at):
+        # another attempt only if retries are left and it starts before the deadline
+        if attempt >= self.max_retries:
+            return False
+        return deadline_at is None or time.monotonic() + delay < deadline_at
+
+    def _attempt_timeout(self, deadline_at):
+        # self.timeout, with every part cut to the time left before the deadline
+        if deadline_at is None:
+            return self.timeout
+        remaining = max(0.001, deadline_at - time.monotonic())
+        if isinstance(self.timeout, tuple):
+            return tuple(remaining if part is None else min(part, remaining) for part in self.timeout)
+        return remaining if self.timeout is None else min(self.timeout, remaining)
+
+    def _record_metrics(self, task, latency, status=None, response_text=None):
+        if self.metrics is not None:
+            self.metrics.record(task or "chat", MODEL_NAME, latency, status, response_text)
+
+    def _send_once(self, url, payload, task=None, timeout=None, attempt=None):
+        """
+        One POST on the shared session, holding a self.limiter slot for the
+        duration of the call. With url=None the request goes to an endpoint of
+        self.endpoints, or to DEFAULT_CHAT_URL when there is no pool. The call is
+        recorded in self.metrics under `task`.
 
-    def model_predict_comments_classification_api(self, text , url = "http://localhost:5000/v1/api/chat"):
-        payload = json.dumps({
-            "model": "yasserrmd/ALLaM-7B-Instruct-preview",
-            "messages": [
-            {
-                "role": "system",
-                "content": "You are a precise text classifier.\n\nTASK\nClassify the TEXT into exactly one label from LABELS.\n\nRULES\n- Choose the single best label (no ties).\n- Prefer \"Other\" if ambiguous.\n- OUTPUT MUST BE ONLY ONE JSON OBJECT. NO EXTRA TEXT.\n\nFORMAT\n{\"label\": \"<one of the labels>\", \"confidence\": <0..1>, \"reason\": \"<max 20 words>\"}\n\nLABELS {\"Mobile App\", \"auto_loan\", \"Credit/Debit Card\", \"Loan\", \"Prizes\", \"Competition\", \"Customer Service\", \"Other\"}\n\nGUIDANCE\n- Text may be English or Arabic (or mixed).\n- If meaning unclear → label = \"Other\".\n- DO NOT write explanations outside JSON.\n\nWhen you see TEXT:, classify it using the format above.\nAfter TEXT:, reply ONLY with JSON.\n"
-            },
-            {
-                "role": "user",
-                "content": f"TEXT:{text}"
-            }
-            ],
-            "stream": False
-        })
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': 'Bearer demo'
-        }
-        response = requests.request("POST", url, headers=headers, data=payload)
-        # print(response.text)
-        return response.text
+        :param timeout: requests timeout of this call (default self.timeout).
+        :param attempt: _HedgedAttempt through which _send_hedged can cancel the call.
+        """
+        pooled = url is None and self.endpoints is not None
+        # take the limiter slot before the endpoint, so waiting for a slot
+        # doesn't count as an outstanding request on the endpoint
+        if self.limiter is not None:
+            self.limiter.acquire()
+        if attempt is not None:
+            attempt.thread = threading.get_ident()
+            if attempt.cancelled:
+                if self.limiter is not None:
+                    self.limiter.release(key=task)
+                raise _HedgeCancelled()
+        if url is None:
+            url = self.endpoints.acquire() if pooled else DEFAULT_CHAT_URL
+        start = time.perf_counter()
+        try:
+            response = self.session.post(url, headers=API_HEADERS, data=payload,
+                                         timeout=self.timeout if timeout is None else timeout)
+        except Exception:
+            cancelled = attempt is not None and attempt.cancelled
+            self._record_metrics(task, time.perf_counter() - start)
+            # a cancelled hedge says nothing about the server's load or health
+            if self.limiter is not None:
+                self.limiter.release(error=not cancelled, key=task)
+            if pooled:
+                self.endpoints.release(url, ok=None if cancelled else False)
+            if cancelled:
+                raise _HedgeCancelled()
+            raise
+        latency = time.perf_counter() - start
+        self._record_metrics(task, latency, response.status_code, response.text)
+        if self.limiter is not None:
+            self.limiter.release(latency, response.status_code, key=task)
+        if pooled:
+            self.endpoints.release(url, ok=response.status_code < 500)
+        if response.status_code < 500:
+            self._record_latency(task, latency)
+        return response
+
+    def _send_hedged(self, url, payload, task=None, timeout=None):
+        # _send_once, plus a duplicate request if the first one is slower than the
+        # p95; the losing request is cancelled
+        delay = self._hedge_delay(task)
+        if delay is None:
+            return self._send_once(url, payload, task, timeout)
+        if self._hedge_executor is None:
+            with self._stats_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=self.max_workers * 2)
+
+        primary_attempt = _HedgedAttempt()
+        primary = self._hedge_executor.submit(self._send_once, url, payload, task, timeout, primary_attempt)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup_attempt = _HedgedAttempt()
+        backup = self._hedge_executor.submit(self._send_once, url, payload, task, timeout, backup_attempt)
+        attempts = {primary: primary_attempt, backup: backup_attempt}
+        for future in as_completed([primary, backup]):
+            if future.exception() is None:
+                for other, other_attempt in attempts.items():
+                    if other is not future:
+                        other_attempt.cancel(other)
+                if future is backup:
+                    self._count("hedge_wins")
+                return future.result()
+        return primary.result()
+
+    def _send(self, url, payload, task=None):
+        """
+        POST one chat payload and return the requests Response.
 
+        Connection errors, timeouts and RETRY_STATUSES answers are retried up to
+        self.max_retries times with jittered exponential backoff, as long as
+        self.deadline allows; with self.hedge slow attempts are duplicated.
+        """
+        deadline_at = time.monotonic() + self.deadline if self.deadline is not None else None
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._send_hedged(url, payload, task, self._attempt_timeout(deadline_at))
+            except (requests.ConnectionError, requests.Timeout):
+                delay = self._retry_delay(attempt, deadline_at)
+                if not self._may_retry(attempt, delay, deadline_at):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self._retry_delay(attempt, deadline_at)
+                if not self._may_retry(attempt, delay, deadline_at):
+                    return response
+            self._count("retries")
+            time.sleep(delay)
+
+    async def _send_once_async(self, http, url, payload, task=None, timeout=None):
+        """
+        Async counterpart of _send_once.
 
+        Returns:
+            tuple: (status code, response text)
+        """
+        import aiohttp
+
+        pooled = url is None and self.endpoints is not None
+        # a hedged duplicate may be cancelled while it waits for a limiter slot;
+        # the endpoint is only taken once nothing can interrupt before the try
+        if self.limiter is not None:
+            await self.limiter.acquire_async()
+        if url is None:
+            url = self.endpoints.acquire() if pooled else DEFAULT_CHAT_URL
+        start = time.perf_counter()
+        status = None
+        options = {}
+        if timeout is not None:
+            if isinstance(timeout, tuple):
+                connect, read = timeout
+                options["timeout"] = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read,
+                                                           total=max(part for part in timeout if part is not None))
+            else:
+                options["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        cancelled = False
+        try:
+            async with http.post(url, data=payload, headers=API_HEADERS, **options) as response:
+                response_text = await response.text()
+                status = response.status
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # also runs when a hedged duplicate is cancelled; that one says nothing
+            # about the server's load or health
+            latency = time.perf_counter() - start
+            self._record_metrics(task, latency, status, response_text if status is not None else None)
+            # the endpoint first: nothing awaits before it
+            if pooled:
+                self.endpoints.release(url, ok=None if cancelled else status is not None and status < 500)
+            if self.limiter is not None:
+                if cancelled:
+                    await self.limiter.release_async(key=task)
+                elif status is None:
+                    await self.limiter.release_async(error=True, key=task)
+                else:
+                    await self.limiter.release_async(latency, status, key=task)
+        if status < 500:
+            self._record_latency(task, latency)
+        return status, response_text
+
+    async def _send_hedged_async(self, http, url, payload, task=None, timeout=None):
+        # async counterpart of _send_hedged; the losing request is cancelled
+        delay = self._hedge_delay(task)
+        if delay is None:
+            return await self._send_once_async(http, url, payload, task, timeout)
+
+        primary = asyncio.ensure_future(self._send_once_async(http, url, payload, task, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup = asyncio.ensure_future(self._send_once_async(http, url, payload, task, timeout))
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is backup:
+                        self._count("hedge_wins")
+                    return future.result()
+        return primary.result()
+
+    async def _send_async(self, http, url, payload, task=None):
+        """
+        Async counterpart of _send.
 
-    def model_predict_posts_classification_api(self, text , url = "http://localhost:5000/v1/api/chat"):
-        payload = json.dumps({
-            "model": "yasserrmd/ALLaM-7B-Instruct-preview",
-            "messages": [
-            {
-                "role": "system",
-                "content": "You are a precise banking text classifier.\n\nTASK\nClassify the TEXT into exactly one label from LABELS.\n\nRULES\n- Choose the single best label (no ties).\n- Prefer \"Other\" if ambiguous.\n- OUTPUT MUST BE ONLY ONE JSON OBJECT. NO EXTRA TEXT.\n\nFORMAT\n{\"label\": \"<one of the labels>\", \"confidence\": <0..1>, \"reason\": \"<max 20 words>\"}\n\nLABELS {\"Mobile App\", \"auto_loan\", \"Credit/Debit Card\", \"Loan\", \"Prizes\", \"Competition\", \"Customer Service\", \"Other\"}\n\nGUIDANCE\n- Text may be English or Arabic (or mixed).\n- If meaning unclear → label = \"Other\".\n- DO NOT write explanations outside JSON.\n\nWhen you see TEXT:, classify it using the format above.\nAfter TEXT:, reply ONLY with JSON.\n"
-            },
-            {
-                "role": "user",
-                "content": f"TEXT:{text}"
-            }
-            ],
-            "stream": False
-        })
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': 'Bearer demo'
-        }
-        response = requests.request("POST", url, headers=headers, data=payload)
-        # print(response.text)
+        Returns:
+            tuple: (True if the status is below 400, response text)
+        """
+        import aiohttp
+
+        deadline_at = time.monotonic() + self.deadline if self.deadline is not None else None
+        for attempt in range(self.max_retries + 1):
+            try:
+                timeout = self._attempt_timeout(deadline_at) if deadline_at is not None else None
+                status, response_text = await self._send_hedged_async(http, url, payload, task, timeout)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                delay = self._retry_delay(attempt, deadline_at)
+                if not self._may_retry(attempt, delay, deadline_at):
+                    raise
+            else:
+                if status not in RETRY_STATUSES:
+                    return status < 400, response_text
+                delay = self._retry_delay(attempt, deadline_at)
+                if not self._may_retry(attempt, delay, deadline_at):
+                    return status < 400, response_text
+            self._count("retries")
+            await asyncio.sleep(delay)
+
+    def _cache_get(self, key):
+        # a cached answer cost no model time, so it doesn't carry the stored request's timings
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        try:
+            data = json.loads(cached)
+        except ValueError:
+            return cached
+        return json.dumps(self._share_timings(data, None), ensure_ascii=False) if isinstance(data, dict) else cached
+
+    def _cache_key(self, task, text):
+        if self.cache is None:
+            return None
+        return self.cache.make_key(text, task.system_prompt, task.model, task.cache_options)
+
+    def _post_chat(self, task, text, url=None):
+        """
+        Send one chat request for a ChatTask and return the raw response text,
+        answering from self.cache when the same text/prompt/model was already
+        classified. Only successful responses whose answer parses are cached, so
+        a malformed or num_predict-truncated answer is asked again next time.
+        A request that still fails after its retries gives an {"error": ...}
+        body (see _failed_response), which parse_response reports as parse_error.
+        """
+        key = self._cache_key(task, text)
+        if key is not None:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+        try:
+            response = self._send(url, task.payload(text), task.name)
+        except requests.RequestException as e:
+            return self._failed_response(e)
+        if key is not None and response.ok and self._answer_parses(task, response.text):
+            self.cache.put(key, response.text)
         return response.text
 
+    def _answer_parses(self, task, response_text):
+        fields = TASK_ANSWER_FIELDS.get(task.name, ())
+        if task.name == "combined":
+            texts = self.split_combined_response(response_text)
+        else:
+            texts = [response_text] * len(fields)
+        return all(self.parse_response(text, field)["parse_error"] is None for text, field in zip(texts, fields))
+
+    def _failed_response(self, error):
+        # stands in for the response of a request that failed for good (retries or
+        # deadline used up), so it becomes a parse_error row instead of ending the run
+        self._count("failures")
+        return json.dumps({"error": f"request failed: {type(error).__name__}: {error}"}, ensure_ascii=False)
+
+    def _task(self, name):
+        """
+        The TASKS entry `name` adapted to self.output_mode: in the "schema" and
+        "labels" modes its answer is constrained by the RESPONSE_SCHEMAS entry
+        (without reason for "labels") and capped with num_predict. Built once.
+        """
+        task = self._tasks.get(name)
+        if task is None:
+            task = TASKS[name]
+            if self.output_mode != "prompt":
+                schema = copy.deepcopy(RESPONSE_SCHEMAS[name])
+                system_prompt = task.system_prompt
+                if self.output_mode == "labels":
+                    del schema["properties"]["reason"]
+                    schema["required"] = [field for field in schema["required"] if field != "reason"]
+                    system_prompt += LABELS_ONLY_INSTRUCTIONS
+                num_predict = self.num_predict or RESPONSE_TOKEN_LIMITS[self.output_mode]
+                task = task.derive(system_prompt=system_prompt, response_format=schema,
+                                   options={**task.options, "num_predict": num_predict})
+            self._tasks[name] = task
+        return task
+
+    def _batch_task(self, task, size):
+        """
+        The batched variant of a task: BATCH_INSTRUCTIONS appended to the system
+        prompt, the JSON list of items as user message and, if the task has a
+        JSON schema format, the same schema wrapped in {"results": [...]}. A
+        num_predict cap is scaled to the `size` items of the batch.
+        Built once per task (and batch size when capped).
+        """
+        per_item = task.options.get("num_predict")
+        cache_key = (task.name, size if per_item else None)
+        batch_task = self._batch_tasks.get(cache_key)
+        if batch_task is None:
+            response_format = None
+            if isinstance(task.response_format, dict):
+                item_format = copy.deepcopy(task.response_format)
+                item_format["properties"]["id"] = {"type": "integer"}
+                item_format["required"] = item_format.get("required", []) + ["id"]
+                response_format = {
+                    "type": "object",
+                    "properties": {"results": {"type": "array", "items": item_format}},
+                    "required": ["results"],
+                }
+            options = dict(task.options)
+            if per_item:
+                options["num_predict"] = per_item * size + BATCH_TOKEN_OVERHEAD
+            batch_task = task.derive(name=f"{task.name}_batch", system_prompt=task.system_prompt + BATCH_INSTRUCTIONS,
+                                     response_format=response_format, options=options, user_template="{text}")
+            self._batch_tasks[cache_key] = batch_task
+        return batch_task
+
+    def _batch_payload(self, task, texts):
+        items = [{"id": i, "text": text} for i, text in enumerate(texts)]
+        return self._batch_task(task, len(texts)).payload(json.dumps(items, ensure_ascii=False))
+
+    def parse_batch_response(self, response_text, size):
+        """
+        Split a batched response into one response text per item, shaped like
+        the response of a single-comment call.
 
+        :param response_text: raw response body of a batched request.
+        :param size: number of items sent in the batch.
+        :return: list of `size` response texts, None for every item whose
+                 answer is missing or can't be parsed.
+        """
+        parsed = [None] * size
+        try:
+            data = json.loads(response_text)
+            content = json.loads(self._message_content(data))
+        except (ValueError, TypeError, KeyError, IndexError):
+            return parsed
+        answers = content.get("results") if isinstance(content, dict) else content
+        if not isinstance(answers, list):
+            return parsed
+        data = self._share_timings(data, size)
+        for answer in answers:
+            if not isinstance(answer, dict):
+                continue
+            item_id = answer.get("id")
+            if isinstance(item_id, int) and 0 <= item_id < size and parsed[item_id] is None:
+                item = {k: v for k, v in answer.items() if k != "id"}
+                parsed[item_id] = self._with_message_content(data, item)
+        return parsed
+
+    def _batch_cache_lookup(self, task, texts):
+        # returns the cache keys, the cached answers (None on a miss) and the indexes still to send
+        keys = [self._cache_key(task, text) for text in texts]
+        results = [self._cache_get(key) if key is not None else None for key in keys]
+        todo = [i for i, result in enumerate(results) if result is None]
+        return keys, results, todo
+
+    def _batch_fill(self, task, keys, results, todo, parsed):
+        # store parsed answers, return the indexes that need a per-item fallback call
+        missing = []
+        for i, item_text in zip(todo, parsed):
+            if item_text is None:
+                missing.append(i)
+                continue
+            results[i] = item_text
+            if keys[i] is not None and self._answer_parses(task, item_text):
+                self.cache.put(keys[i], item_text)
+        with self._stats_lock:
+            self.batch_requests += 1
+            self.batch_fallbacks += len(missing)
+        return missing
+
+    def _post_chat_batch(self, task, texts, url=None):
+        """
+        Classify several texts with one request; returns one response text per
+        text. Cached texts are not sent, and texts the batched answer doesn't
+        cover fall back to _post_chat.
+        """
+        keys, results, todo = self._batch_cache_lookup(task, texts)
+        if todo:
+            payload = self._batch_payload(task, [texts[i] for i in todo])
+            try:
+                response = self._send(url, payload, f"{task.name}_batch")
+            except requests.RequestException as e:
+                # no per-item fallback: those calls would hit the same failure one by one
+                failed = self._failed_response(e)
+                return [failed if result is None else result for result in results]
+            parsed = self.parse_batch_response(response.text, len(todo)) if response.ok else [None] * len(todo)
+            for i in self._batch_fill(task, keys, results, todo, parsed):
+                results[i] = self._post_chat(task, texts[i], url)
+        return results
+
+    async def _post_chat_batch_async(self, http, task, texts, url=None):
+        # async counterpart of _post_chat_batch
+        import aiohttp
+
+        keys, results, todo = self._batch_cache_lookup(task, texts)
+        if todo:
+            payload = self._batch_payload(task, [texts[i] for i in todo])
+            try:
+                ok, response_text = await self._send_async(http, url, payload, f"{task.name}_batch")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failed = self._failed_response(e)
+                return [failed if result is None else result for result in results]
+            parsed = self.parse_batch_response(response_text, len(todo)) if ok else [None] * len(todo)
+            for i in self._batch_fill(task, keys, results, todo, parsed):
+                results[i] = await self._post_chat_async(http, task, texts[i], url)
+        return results
+
+    def parse_response(self, response_text, field):
+        """
+        Parse one chat response into plain values.
 
+        :param response_text: raw response body (Ollama /api/chat or OpenAI compatible).
+        :param field: the answer field asked for in the prompt, "sentiment" or "label".
+        :return: dict with `field`, confidence, reason, parse_error (None when the
+                 answer was read fine) and the OLLAMA_TIMING_FIELDS (this row's
+                 share of the request, see OLLAMA_TIMING_FIELDS).
+        """
+        parsed = {field: None, "confidence": None, "reason": None, "parse_error": None}
+        parsed.update({name: None for name in OLLAMA_TIMING_FIELDS})
+        try:
+            data = json.loads(response_text)
+        except (ValueError, TypeError):
+            parsed["parse_error"] = "response is not JSON"
+            return parsed
+        if not isinstance(data, dict):
+            parsed["parse_error"] = "unexpected response shape"
+            return parsed
+        if "error" in data:
+            parsed["parse_error"] = str(data["error"])
+            return parsed
+
+        for name in OLLAMA_TIMING_FIELDS:
+            if isinstance(data.get(name), int):
+                parsed[name] = data[name]
+        usage = data.get("usage")
+        if isinstance(usage, dict):
+            parsed["prompt_eval_count"] = usage.get("prompt_tokens")
+            parsed["eval_count"] = usage.get("completion_tokens")
 
+        try:
+            content = self._message_content(data)
+        except (KeyError, IndexError, TypeError):
+            parsed["parse_error"] = "no message content"
+            return parsed
+        # tolerate code fences or text around the JSON object
+        start, end = content.find("{"), content.rfind("}")
+        try:
+            answer = json.loads(content[start:end + 1]) if start != -1 and end > start else None
+        except ValueError:
+            answer = None
+        if not isinstance(answer, dict):
+            parsed["parse_error"] = "message content is not a JSON object"
+            return parsed
 
+        value = answer.get(field)
+        parsed[field] = str(value) if value is not None else None
+        try:
+            parsed["confidence"] = float(answer["confidence"]) if answer.get("confidence") is not None else None
+        except (TypeError, ValueError):
+            pass
+        reason = answer.get("reason")
+        parsed["reason"] = str(reason) if reason is not None else None
+        if parsed[field] is None:
+            parsed["parse_error"] = f"missing '{field}'"
+        return parsed
+
+    def parse_responses(self, response_texts, field):
+        """
+        Parse many chat responses into one typed arrow table: `field`, reason and
+        parse_error as strings, confidence as float64 and the timing/token fields
+        as int64, all nullable.
+        """
+        schema = pa.schema(
+            [(field, pa.string()), ("confidence", pa.float64()), ("reason", pa.string()), ("parse_error", pa.string())]
+            + [(name, pa.int64()) for name in OLLAMA_TIMING_FIELDS]
+        )
+        return pa.Table.from_pylist([self.parse_response(text, field) for text in response_texts], schema=schema)
+
+    def _message_content(self, data):
+        # Ollama /api/chat puts the answer in message.content,
+        # the OpenAI compatible /v1/chat/completions in choices[0].message.content
+        if "choices" in data:
+            return data["choices"][0]["message"]["content"]
+        return data["message"]["content"]
+
+    def _share_timings(self, data, parts):
+        # copy of a response dict with its timing/token fields divided by `parts`,
+        # or dropped with parts=None
+        data = dict(data)
+        for name in OLLAMA_TIMING_FIELDS:
+            if isinstance(data.get(name), int):
+                if parts:
+                    data[name] //= parts
+                else:
+                    del data[name]
+        if isinstance(data.get("usage"), dict):
+            if parts:
+                data["usage"] = {name: value // parts if isinstance(value, int) else value
+                                 for name, value in data["usage"].items()}
+            else:
+                del data["usage"]
+        return data
+
+    def _with_message_content(self, data, content):
+        data = copy.deepcopy(data)
+        message = data["choices"][0]["message"] if "choices" in data else data["message"]
+        message["content"] = json.dumps(content, ensure_ascii=False)
+        return json.dumps(data, ensure_ascii=False)
+
+    def split_combined_response(self, response_text):
+        """
+        Split a combined-task response into the response texts the separate
+        sentiment and comment classification calls would have returned.
 
+        :param response_text: raw response body from model_predict_combined_api.
+        :return: (sentiment response text, classification response text). If the
+                 response can't be parsed, the raw text is returned for both.
+        """
+        try:
+            data = json.loads(response_text)
+            combined = json.loads(self._message_content(data))
+        except (ValueError, TypeError, KeyError, IndexError):
+            return response_text, response_text
+        if not isinstance(combined, dict):
+            return response_text, response_text
+
+        sa = {
+            "sentiment": combined.get("sentiment"),
+            "confidence": combined.get("sentiment_confidence"),
+            "reason": combined.get("reason"),
+        }
+        com = {
+            "label": combined.get("label"),
+            "confidence": combined.get("label_confidence"),
+            "reason": combined.get("reason"),
+        }
+        # one request answered both: its timings stay with the sentiment half only
+        return self._with_message_content(data, sa), self._with_message_content(self._share_timings(data, None), com)
 
+    def model_predict_combined_api(self, text , url = None):
+        return self._post_chat(self._task("combined"), text, url)
 
+    def model_predict_SA_api(self, text , url = None):
+        # text = "أغسطس ٢٠٢٣ ، هادي المجمع والحركة فيه خفيفة رغم أني زرته بعد المغرب ، الخيارات للتسوق ليست كثيرة أعجبني فيه مقهى نصيف القريب من بوابة ٦ و ٧"
+        return self._post_chat(self._task("sentiment"), text, url)
+
+    def model_predict_comments_classification_api(self, text , url = None):
+        return self._post_chat(self._task("comment_classification"), text, url)
+
+    def model_predict_posts_classification_api(self, text , url = None):
+        return self._post_chat(self._task("post_classification"), text, url)
+
+
+    def _posts_topic_task(self, Topics):
+        # one pre-serialized task per list of topics, following self.output_mode like _task
+        topics_key = tuple(Topics)
+        task = self._topic_tasks.get(topics_key)
+        if task is None:
+            options = {**MODEL_OPTIONS, "temperature": 0.0}
+            response_format = None
+            system_prompt = POSTS_TOPIC_SYSTEM_PROMPT_TEMPLATE.format(Topics=Topics)
+            if self.output_mode != "prompt":
+                properties = {"topic": {"type": "string", "enum": list(Topics)}, "confidence": {"type": "number"}}
+                if self.output_mode == "schema":
+                    properties["reason"] = {"type": "string"}
+                else:
+                    system_prompt += LABELS_ONLY_INSTRUCTIONS
+                response_format = {"type": "object", "properties": properties, "required": list(properties)}
+                options["num_predict"] = self.num_predict or RESPONSE_TOKEN_LIMITS[self.output_mode]
+            task = ChatTask("post_topic", system_prompt, MODEL_NAME, response_format=response_format,
+                            options=options, keep_alive=KEEP_ALIVE, user_template='TEXT: "{text}"')
+            self._topic_tasks[topics_key] = task
+        return task
+
+    def classify_Posts_Topic(self, Topics, text, url=None):
+        """
+        Classify one post into one of `Topics`, through the same endpoints,
+        limiter, retries and cache as the comment tasks.
 
-    def classify_Posts_Topic(self,Topics,text):
-        system_prompt = f"""
-        You are a precise JSON generator.
+        Returns:
+            dict: the parsed chat response.
+        """
+        return json.loads(self._post_chat(self._posts_topic_task(Topics), text, url))
 
-        TASK
-        Read the TEXT and classify it into exactly one topic. Output only one JSON object.
+    def predict_post_topics(self, df, topics, post_col="post_pk", text_col="post_text", engine="threads", max_in_flight=1000):
+        """
+        Classify the topic of every post once, however many comment rows repeat it.
+
+        :param df: frame with one row per comment (or per post) holding `post_col` and `text_col`.
+        :param topics: allowed topics, e.g. posts_TOPICS.
+        :param engine: "threads" or "async", as in run_prediction.
+        :param max_in_flight: concurrency limit for the "async" engine.
+        :return: DataFrame with one row per non-empty post: `post_col`, post_topic,
+                 post_topic_confidence, post_topic_reason and post_topic_parse_error.
+        """
+        posts = df[[post_col, text_col]].drop_duplicates(post_col)
+        posts = posts[posts[text_col].fillna("").astype(str).str.strip() != ""].reset_index(drop=True)
+        task = self._posts_topic_task(topics)
+        items = list(zip(range(len(posts)), posts[text_col].astype(str)))
+        if len(df):
+            print(f"Post topics: {len(items):,} posts for {len(df):,} rows")
+
+        async def classify_async(http, batch):
+            return [(key, await self._post_chat_async(http, task, text)) for key, text in batch]
+
+        results = self._run_batches(
+            ([item] for item in items), len(items), engine, max_in_flight,
+            lambda batch: [(key, self._post_chat(task, text)) for key, text in batch],
+            classify_async,
+        )
+        self._print_run_stats()
 
-        RULES
-        - Choose exactly one topic from the allowed list.
-        - If unsure, pick the closest valid topic.
-        - Text may be English, Arabic, or mixed.
-        - Output MUST be valid JSON.
-        - Output MUST start with '{{' and end with '}}'.
-        - Do NOT include markdown, code fences, or any explanation.
-        - Do NOT output any text before or after the JSON object.
+        parsed = self.parse_responses([results[key] for key, _ in items], "topic")
+        topics_df = posts[[post_col]].copy()
+        for name in ("topic", "confidence", "reason", "parse_error"):
+            column = "post_topic" if name == "topic" else f"post_topic_{name}"
+            topics_df[column] = parsed.column(name).to_pandas(types_mapper=pd.ArrowDtype).array
+        return topics_df
 
-        TOPICS
-        {Topics}
+    def run_post_topics(self, df, topics, save_Folder_Path, save_Folder_model_topic_Path, post_col="post_pk", text_col="post_text",
+                        engine="threads", max_in_flight=1000, output_format="csv", keep_text=False):
+        """
+        Post-level topic job: classify each post once (predict_post_topics), join
+        the topic columns back onto every comment row of the post and save the
+        result to <save_Folder_Path>/<save_Folder_model_topic_Path>/post_topics.csv
+        (or .parquet).
 
-        FORMAT
-        Return exactly one JSON object with this schema:
-        {{
-        "topic": "<one topic only>",
-        "confidence": <number between 0 and 1>,
-        "reason": "<max 15 words>"
-        }}
+        Args:
+            keep_text (bool): keep `text_col` in the output; by default the post text,
+                repeated on every comment row, is dropped.
 
-        IMPORTANT
-        - No ```json fences.
-        - No comments.
-        - No extra text.
-        - JSON only.
+        Returns:
+            pd.DataFrame: `df` with the post_topic* columns added (missing for empty posts).
         """
+        topics_df = self.predict_post_topics(df, topics, post_col, text_col, engine, max_in_flight)
+        if self.cache is not None:
+            print(f"Prediction cache: {self.cache.stats()}")
+        if not keep_text:
+            df = df.drop(columns=[text_col])
+        df = df.merge(topics_df, on=post_col, how="left")
+
+        output_folder = os.path.join(save_Folder_Path , save_Folder_model_topic_Path)
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        if output_format == "parquet":
+            df.to_parquet(os.path.join(output_folder , "post_topics.parquet") , index=False)
+        else:
+            df.to_csv(os.path.join(output_folder , "post_topics.csv") , index=False)
+        return df
 
-        payload = {
-            "model": "yasserrmd/ALLaM-7B-Instruct-preview",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"TEXT: \"{text}\""}
-            ],
-            "temperature": 0.0
-        }
+    def run_post_topics_stream(self, path, topics, save_Folder_Path, save_Folder_model_topic_Path, post_col="post_pk",
+                               text_col="post_text", id_col="Comment_pk", chunk_rows=50_000, engine="threads",
+                               max_in_flight=1000, output_format="csv"):
+        """
+        run_post_topics over a file read in chunks (read_comments_in_chunks), for
+        inputs where every comment row repeats its post text. Only one text per
+        post is ever held in memory: the first pass collects the unique posts
+        chunk by chunk, the second streams (`id_col`, `post_col`) chunks, joins
+        the topic columns and appends them to the output file.
 
-        headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+        Returns:
+            str: path of post_topics.csv / .parquet.
+        """
+        seen = set()
+        posts = []
+        rows = 0
+        for chunk in self.read_comments_in_chunks(path, (post_col, text_col), chunk_rows):
+            rows += len(chunk)
+            chunk = chunk.drop_duplicates(post_col)
+            chunk = chunk[~chunk[post_col].isin(seen)]
+            seen.update(chunk[post_col])
+            posts.append(chunk)
+        del seen
+        posts = pd.concat(posts, ignore_index=True) if posts else pd.DataFrame(columns=[post_col, text_col])
+        print(f"Post topics: {len(posts):,} distinct posts in {rows:,} rows")
+        topics_df = self.predict_post_topics(posts, topics, post_col, text_col, engine, max_in_flight)
+        del posts
+        if self.cache is not None:
+            print(f"Prediction cache: {self.cache.stats()}")
 
-        response = requests.post(API_URL, json=payload, headers=headers)
-        return response.json()
+        output_folder = os.path.join(save_Folder_Path , save_Folder_model_topic_Path)
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        chunks = (chunk.merge(topics_df, on=post_col, how="left")
+                  for chunk in self.read_comments_in_chunks(path, (id_col, post_col), chunk_rows))
+        if output_format == "parquet":
+            output_path = os.path.join(output_folder , "post_topics.parquet")
+            writer = None
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            if writer is not None:
+                writer.close()
+        else:
+            output_path = os.path.join(output_folder , "post_topics.csv")
+            header = True
+            with open(output_path, "w", encoding="utf-8", newline="") as f:
+                for chunk in chunks:
+                    chunk.to_csv(f, index=False, header=header)
+                    header = False
+        return output_path
 
 
 
@@ -331,9 +2015,6 @@ if __name__ == "__main__":
 
 
 
-    API_URL = "http://YOUR-ENDPOINT/v1/chat/completions"
-    API_KEY = "YOUR_API_KEY"
-
     posts_TOPICS = [
         "Mobile App",
         "Auto Loan",
@@ -347,17 +2028,44 @@ if __name__ == "__main__":
 
 
 
-    ai = Model_predictor()
+    # comma-separated list of chat endpoints, one per GPU instance
+    chat_urls = os.environ.get("LLM_URLS", DEFAULT_CHAT_URL).split(",")
+
+    ai = Model_predictor(
+        max_workers=10,
+        endpoints=EndpointPool(chat_urls, headers=API_HEADERS).start(),
+        limiter=AIMDConcurrencyLimiter(initial_limit=10, max_limit=64),
+        rules=DEFAULT_RULES,
+        cache=PredictionCache(os.path.join(os.getcwd(), "AI_models", "prediction_cache.sqlite"), max_age_days=90),
+        metrics=RequestMetrics(),
+        # enforce the answer schema and cap decoding; "labels" also drops the reason
+        output_mode="schema",
+    )
 
 
-    df = pd.read_csv(os.path.join(os.getcwd() , "AI_models",filename_to_process) , dtype = str)
-    # select comments and id 
-    df = df[["post_pk","Comment_pk","post_text" , "Comment_text"]]
-    df["id"] = df["Comment_pk"].copy()
-    # filter out the mention comments 
-    df = ai.process_comments( df, comment_column="Comment_text")
+    # stream only the id and text columns, chunk by chunk
+    chunks = ai.read_comments_in_chunks(
+        os.path.join(os.getcwd() , "AI_models",filename_to_process),
+        columns=("Comment_pk", "Comment_text"),
+        chunk_rows=50_000,
+    )
+    # flag the mention-only comments
+    chunks = (ai.process_comments(chunk, comment_column="Comment_text") for chunk in chunks)
 
-    # # analize the comments
-    ai.run_prediction(df ,processCol="Comment_text", save_Folder_Path= save_Folder_Path , save_Folder_model_topic_Path=save_Folder_model_topic_Path)
+    # # analize the comments (resume=True continues an interrupted run)
+    output_path = ai.run_prediction_stream(chunks, processCol="Comment_text", save_Folder_Path= save_Folder_Path , save_Folder_model_topic_Path=save_Folder_model_topic_Path, resume=False)
     # save the results in s3 
-    ai.save_df_to_s3(df, bucket_name=bucket_name, key=f"{save_Folder_model_topic_Path}/predicted_analysis.csv")
+    ai.save_file_to_s3(output_path, bucket_name=bucket_name, key=f"{save_Folder_model_topic_Path}/predicted_analysis.csv")
+
+    # classify every post once and join its topic back onto the comment rows
+    ai.run_post_topics_stream(os.path.join(os.getcwd() , "AI_models",filename_to_process), posts_TOPICS,
+                              save_Folder_Path, "post_topic", chunk_rows=50_000)
+    ai.save_file_to_s3(os.path.join(save_Folder_Path, "post_topic", "post_topics.csv"), bucket_name=bucket_name, key="post_topic/post_topics.csv")
+
+    # where the time went: prompt eval, decoding, loading or queueing/network
+    metrics_folder = os.path.join(save_Folder_Path, save_Folder_model_topic_Path)
+    ai.metrics.export(os.path.join(metrics_folder, "request_metrics.json"))
+    ai.metrics.export(os.path.join(metrics_folder, "request_metrics.prom"))
+
+    # evict expired entries and release the SQLite file
+    ai.cache.close()
@@ -0,0 +1,7 @@
+"""
+Benchmarks of the Python side of the pipeline (cleaning, prediction fan-out,
+S3 upload, CSV to Parquet conversion), runnable without a GPU box thanks to
+the stub Ollama server in benchmarks.stub_ollama.
+
+Run the whole suite with `python -m benchmarks.run`.
+"""
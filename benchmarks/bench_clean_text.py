@@ -0,0 +1,44 @@
+"""
+Benchmark Model_predictor.clean_text (row by row) against clean_series (batch).
+
+Usage:
+    python -m benchmarks.bench_clean_text --rows 200000 --unique-ratio 0.3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SA_Modeling_ollama import Model_predictor
+from benchmarks.synthetic import synthetic_comments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--unique-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+
+    ai = Model_predictor()
+    series = synthetic_comments(args.rows, args.unique_ratio)
+
+    start = time.perf_counter()
+    before = series.apply(ai.clean_text)
+    before_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    after = ai.clean_series(series)
+    after_s = time.perf_counter() - start
+
+    if before.tolist() != after.tolist():
+        raise SystemExit("clean_series output differs from clean_text")
+
+    print(f"rows: {args.rows:,}  unique ratio: {args.unique_ratio}")
+    print(f"clean_text   : {args.rows / before_s:,.0f} rows/sec ({before_s:.2f}s)")
+    print(f"clean_series : {args.rows / after_s:,.0f} rows/sec ({after_s:.2f}s)")
+    print(f"speedup      : {before_s / after_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
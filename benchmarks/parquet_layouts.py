@@ -0,0 +1,117 @@
+"""
+Report comparing Parquet layouts of the same CSV: file size, conversion time
+and scan speed of typed/dictionary/zstd layouts against the all-strings
+Snappy baseline the converters have always written.
+
+Every layout is written with convert_csv_to_parquet_all_strings and read back
+with pyarrow (whole file, one column, and to pandas); scan times are the best
+of --repeat runs. Prints one JSON record per layout, with its size and scan
+times relative to the baseline.
+
+Usage:
+    python -m benchmarks.parquet_layouts --rows 1000000 --output layouts.json
+    python -m benchmarks.parquet_layouts --input export.csv --column Comment_text
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import pyarrow.parquet as pq
+
+from parquet_layout import ParquetLayout
+
+
+LAYOUTS = {
+    "strings-snappy": ParquetLayout(),
+    "typed-snappy": ParquetLayout(typed=True),
+    "typed-zstd3": ParquetLayout(typed=True, compression="zstd", compression_level=3),
+    "typed-zstd9": ParquetLayout(typed=True, compression="zstd", compression_level=9),
+    "typed-zstd3-rg256k-pageindex": ParquetLayout(typed=True, compression="zstd", compression_level=3,
+                                                  row_group_size=256 * 1024, write_page_index=True),
+}
+BASELINE = "strings-snappy"
+
+
+def best_of(repeat, function):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def measure_layout(input_path, output_path, layout, column, repeat):
+    from Chunked_Pandas_to_Parquet import convert_csv_to_parquet_all_strings
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        convert_csv_to_parquet_all_strings(input_path, output_path, layout=layout)
+    convert_seconds = time.perf_counter() - start
+
+    metadata = pq.ParquetFile(output_path).metadata
+    schema = pq.read_schema(output_path)
+    column = column or schema.names[0]
+    return {
+        "size_mb": round(os.path.getsize(output_path) / 1024 ** 2, 2),
+        "convert_seconds": round(convert_seconds, 3),
+        "row_groups": metadata.num_row_groups,
+        "types": {field.name: str(field.type) for field in schema},
+        "scan_seconds": round(best_of(repeat, lambda: pq.read_table(output_path)), 4),
+        "column_scan_seconds": round(best_of(repeat, lambda: pq.read_table(output_path, columns=[column])), 4),
+        "to_pandas_seconds": round(best_of(repeat, lambda: pq.read_table(output_path).to_pandas()), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=None, help="CSV to convert (default: a synthetic export)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows of the synthetic export")
+    parser.add_argument("--column", default=None, help="column read by the one-column scan (default: the first)")
+    parser.add_argument("--repeat", type=int, default=3, help="scans per layout, the fastest is kept")
+    parser.add_argument("--output", default=None, help="write all results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        input_path = args.input
+        if input_path is None:
+            from benchmarks.synthetic import write_synthetic_csv
+            input_path = os.path.join(folder, "input.csv")
+            write_synthetic_csv(input_path, args.rows, numeric_ids=True)
+
+        baseline = None
+        for name, layout in LAYOUTS.items():
+            print(f"writing {name} ...", file=sys.stderr)
+            record = {"layout": name, **measure_layout(input_path, os.path.join(folder, f"{name}.parquet"),
+                                                       layout, args.column, args.repeat)}
+            if name == BASELINE:
+                baseline = record
+            for key in ("size_mb", "scan_seconds", "column_scan_seconds", "to_pandas_seconds"):
+                record[f"{key}_vs_baseline"] = round(record[key] / baseline[key], 3) if baseline[key] else None
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+            results.append(record)
+
+        input_mb = round(os.path.getsize(input_path) / 1024 ** 2, 2)
+
+    if args.output:
+        report = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "input": args.input or f"synthetic ({args.rows:,} rows)",
+            "input_mb": input_mb,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
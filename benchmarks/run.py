@@ -0,0 +1,268 @@
+"""
+Benchmark suite: throughput, latency and peak RSS of the Python side of the
+pipeline, with a local stub Ollama server in place of the GPU box.
+
+Every case runs in a fresh process (so its peak RSS is its own) and prints one
+JSON record per line:
+    {"benchmark": ..., "variant": ..., "rows": ..., "seconds": ..., "rows_per_sec": ...,
+     "peak_rss_mb": ..., ...}
+--output also writes all records plus the machine/run details to a JSON file,
+which is what gets compared between commits.
+
+Usage:
+    python -m benchmarks.run --rows 100000 --requests 2000 --output bench.json
+    python -m benchmarks.run --only run_prediction --latency 0.05 --token-rate 80 --parallel 4
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles_ms(latencies):
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+
+# ---------- benchmark cases ----------
+# Each case gets the suite options, does its own setup and returns a dict with
+# at least "rows" and "seconds" (the measured part only).
+
+def bench_clean_text(options, variant):
+    from SA_Modeling_ollama import Model_predictor
+    from benchmarks.synthetic import synthetic_comments
+
+    ai = Model_predictor()
+    series = synthetic_comments(options["rows"], options["unique_ratio"])
+    start = time.perf_counter()
+    if variant == "row":
+        series.apply(ai.clean_text)
+    else:
+        ai.clean_series(series)
+    return {"rows": len(series), "seconds": time.perf_counter() - start}
+
+
+def bench_process_comments(options, variant):
+    from SA_Modeling_ollama import Model_predictor
+    from benchmarks.synthetic import synthetic_frame
+
+    ai = Model_predictor()
+    df = synthetic_frame(options["rows"], options["unique_ratio"])
+    start = time.perf_counter()
+    ai.process_comments(df, "Comment_text")
+    return {"rows": len(df), "seconds": time.perf_counter() - start}
+
+
+PREDICTION_VARIANTS = {
+    "threads": {"engine": "threads"},
+    "async": {"engine": "async"},
+    "threads-combined": {"engine": "threads", "task_mode": "combined"},
+    "threads-batch8": {"engine": "threads", "batch_size": 8},
+    "threads-schema": {"engine": "threads", "output_mode": "schema"},
+    "threads-labels": {"engine": "threads", "output_mode": "labels"},
+}
+
+
+def bench_run_prediction(options, variant):
+    from SA_Modeling_ollama import Model_predictor
+    from benchmarks.synthetic import synthetic_frame
+    from endpoint_pool import EndpointPool
+    from request_metrics import RequestMetrics
+
+    run_options = dict(PREDICTION_VARIANTS[variant])
+    ai = Model_predictor(max_workers=options["max_workers"], endpoints=EndpointPool([options["chat_url"]]),
+                         metrics=RequestMetrics(), output_mode=run_options.pop("output_mode", "prompt"))
+    df = synthetic_frame(options["requests"], options["prediction_unique_ratio"], seed=1)
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        ai.run_prediction(df, "Comment_text", folder, "bench", max_in_flight=options["max_workers"], **run_options)
+        seconds = time.perf_counter() - start
+    # client-side latency of the most recent requests (Model_predictor keeps the last 1000)
+    return {"rows": len(df), "seconds": seconds, "latency_ms": percentiles_ms(list(ai._latencies)),
+            "retries": ai.retries, "tasks": ai.metrics.summary()}
+
+
+def bench_save_df_to_s3(options, variant):
+    from SA_Modeling_ollama import Model_predictor
+    from benchmarks.synthetic import synthetic_frame
+
+    ai = Model_predictor()
+    df = synthetic_frame(options["rows"], options["unique_ratio"])
+    key = f"benchmarks/predicted_analysis.{variant}"
+
+    if options["s3_endpoint_url"] or options["s3_bucket"]:
+        mock = contextlib.nullcontext()
+        bucket = options["s3_bucket"]
+    else:
+        try:
+            from moto import mock_aws
+        except ImportError:
+            return {"skipped": "needs --s3-bucket (and --s3-endpoint-url) or moto installed"}
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            os.environ.setdefault(name, "testing")
+        mock = mock_aws()
+        bucket = "benchmark-bucket"
+
+    with mock:
+        if bucket == "benchmark-bucket":
+            ai.get_s3_client(region_name="us-east-1").create_bucket(Bucket=bucket)
+        start = time.perf_counter()
+        ai.save_df_to_s3(df, bucket, key, region_name="us-east-1", endpoint_url=options["s3_endpoint_url"])
+        seconds = time.perf_counter() - start
+    return {"rows": len(df), "seconds": seconds, "backend": "moto" if bucket == "benchmark-bucket" else "s3"}
+
+
+def bench_parquet_converter(options, variant):
+    from benchmarks.synthetic import write_synthetic_csv
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # the split converters write their parts to the working directory
+        os.chdir(folder)
+        try:
+            input_path = os.path.join(folder, "input.csv")
+            # the temp-CSV split converters cut the file at line breaks, so no newlines inside quoted fields
+            input_bytes = write_synthetic_csv(input_path, options["rows"], unique_ratio=options["unique_ratio"], multiline=False)
+            part_mb = max(1, input_bytes // (4 * 1024 * 1024))
+
+            start = time.perf_counter()
+            if variant.startswith("convert_csv_to_parquet_all_strings"):
+                from Chunked_Pandas_to_Parquet import convert_csv_to_parquet_all_strings
+                engine = "pandas" if variant.endswith("-pandas") else "pyarrow"
+                convert_csv_to_parquet_all_strings(input_path, os.path.join(folder, "output.parquet"), engine=engine)
+            elif variant.startswith("split_csv_and_convert_to_parquet"):
+                from many_small_Parquet_files import split_csv_and_convert_to_parquet
+                mode = "split" if variant.endswith("-split") else "byte_ranges"
+                split_csv_and_convert_to_parquet(input_path, "bench", max_csv_mb=part_mb, mode=mode)
+            else:
+                from many_small_Parquet_files2 import split_csv_and_convert_to_packed_parquet
+                mode = "split" if variant.endswith("-split") else "rolling"
+                split_csv_and_convert_to_packed_parquet(input_path, "bench", max_mb=part_mb, mode=mode)
+            seconds = time.perf_counter() - start
+
+            output_bytes = sum(os.path.getsize(name) for name in os.listdir(folder) if name.endswith(".parquet"))
+        finally:
+            os.chdir(cwd)
+
+    return {"rows": options["rows"], "seconds": seconds, "input_mb": round(input_bytes / 1024 ** 2, 2),
+            "mb_per_sec": round(input_bytes / 1024 ** 2 / seconds, 2), "output_mb": round(output_bytes / 1024 ** 2, 2)}
+
+
+CASES = [
+    ("clean_text", "row", bench_clean_text),
+    ("clean_text", "series", bench_clean_text),
+    ("process_comments", "default", bench_process_comments),
+] + [
+    ("run_prediction", variant, bench_run_prediction) for variant in PREDICTION_VARIANTS
+] + [
+    ("save_df_to_s3", "csv", bench_save_df_to_s3),
+    ("save_df_to_s3", "parquet", bench_save_df_to_s3),
+    ("parquet_converter", "convert_csv_to_parquet_all_strings", bench_parquet_converter),
+    ("parquet_converter", "convert_csv_to_parquet_all_strings-pandas", bench_parquet_converter),
+    ("parquet_converter", "split_csv_and_convert_to_parquet", bench_parquet_converter),
+    ("parquet_converter", "split_csv_and_convert_to_parquet-split", bench_parquet_converter),
+    ("parquet_converter", "split_csv_and_convert_to_packed_parquet", bench_parquet_converter),
+    ("parquet_converter", "split_csv_and_convert_to_packed_parquet-split", bench_parquet_converter),
+]
+
+
+def _run_case(function, options, variant, queue):
+    # child process: keep the converters' progress prints off the JSON output
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            record = function(options, variant)
+    except Exception as e:
+        record = {"error": f"{type(e).__name__}: {e}"}
+    record["peak_rss_mb"] = peak_rss_mb()
+    queue.put(record)
+
+
+def run_case(name, variant, function, options):
+    """Run one case in a fresh process and return its record."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(function, options, variant, queue))
+    process.start()
+    record = queue.get()
+    process.join()
+
+    record = {"benchmark": name, "variant": variant, **record}
+    if record.get("seconds"):
+        record["seconds"] = round(record["seconds"], 4)
+        record["rows_per_sec"] = round(record["rows"] / record["seconds"], 1)
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows for the cleaning, S3 and Parquet cases")
+    parser.add_argument("--unique-ratio", type=float, default=0.3)
+    parser.add_argument("--requests", type=int, default=2_000, help="comments for the run_prediction cases")
+    parser.add_argument("--prediction-unique-ratio", type=float, default=1.0)
+    parser.add_argument("--max-workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.005, help="stub seconds per request")
+    parser.add_argument("--token-rate", type=float, default=None, help="stub generated tokens/sec")
+    parser.add_argument("--prompt-token-rate", type=float, default=None, help="stub prompt tokens/sec")
+    parser.add_argument("--parallel", type=int, default=None, help="stub requests served at once")
+    parser.add_argument("--s3-bucket", default=None, help="real bucket for save_df_to_s3 (default: moto)")
+    parser.add_argument("--s3-endpoint-url", default=None)
+    parser.add_argument("--only", default=None, help="comma-separated benchmark names")
+    parser.add_argument("--output", default=None, help="write all results to this JSON file")
+    args = parser.parse_args()
+
+    from benchmarks.stub_ollama import StubOllamaServer
+
+    selected = set(args.only.split(",")) if args.only else None
+    options = vars(args).copy()
+    results = []
+    with StubOllamaServer(latency=args.latency, token_rate=args.token_rate, prompt_token_rate=args.prompt_token_rate,
+                          parallel=args.parallel) as stub:
+        options["chat_url"] = f"{stub.url}/api/chat"
+        for name, variant, function in CASES:
+            if selected and name not in selected:
+                continue
+            print(f"running {name}/{variant} ...", file=sys.stderr)
+            served = stub.requests
+            record = run_case(name, variant, function, options)
+            if name == "run_prediction":
+                record["stub_requests"] = stub.requests - served
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+            results.append(record)
+
+    if args.output:
+        report = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {k: v for k, v in options.items() if k not in ("output", "only", "chat_url")},
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
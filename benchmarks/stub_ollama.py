@@ -0,0 +1,257 @@
+"""
+Local stand-in for an Ollama server, so the Python side of the pipeline can be
+measured without a GPU box.
+
+Serves POST /api/chat and /v1/api/chat (Ollama format, the second one is the
+path of the EC2 proxy), POST /v1/chat/completions (OpenAI format) and
+GET /api/tags. Every answer is a valid classification JSON built from a hash of
+the text, so parse_response/parse_batch_response work on it, and batched
+requests (BATCH MODE prompts) get one result per item. A JSON schema `format`
+limits the answer to the schema's fields, and options.num_predict truncates it
+(done_reason "length"), as with a real model.
+
+Each request takes `latency` seconds plus the time to "read" the prompt at
+`prompt_token_rate` and to "generate" the answer at `token_rate` tokens/sec.
+With `parallel` set, at most that many requests are served at once and the
+rest queue, like OLLAMA_NUM_PARALLEL on a single GPU.
+
+Usage:
+    python -m benchmarks.stub_ollama --port 11434 --latency 0.05 --token-rate 80 --parallel 4
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+LABELS = ["Mobile App", "auto_loan", "Credit/Debit Card", "Loan", "Prizes", "Competition", "Customer Service", "Other"]
+
+
+def estimate_tokens(text):
+    # ~4 characters per token, close enough for English/Arabic mixes
+    return max(1, len(text) // 4)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        out = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/api/tags":
+            self._reply(200, {"models": [{"name": self.server.stub.model}]})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.rstrip("/")
+        if path not in ("/api/chat", "/v1/api/chat", "/v1/chat/completions"):
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self._reply(400, {"error": "invalid JSON"})
+            return
+        status, response = self.server.stub.answer(request, openai=path == "/v1/chat/completions")
+        self._reply(status, response)
+
+
+class StubOllamaServer:
+    """
+    Threaded HTTP server answering chat requests like Ollama would, with
+    configurable latency and token rates. Use as a context manager or call
+    start()/stop(); `url` is the base URL once started.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_rate=None, prompt_token_rate=None,
+                 parallel=None, error_rate=0.0, model="stub", seed=0):
+        """
+        :param host: interface to bind.
+        :param port: port to bind; 0 picks a free one.
+        :param latency: fixed seconds added to every request.
+        :param token_rate: generated tokens per second (None = instant).
+        :param prompt_token_rate: prompt tokens processed per second (None = instant).
+        :param parallel: requests served at once; the others wait (None = unlimited).
+        :param error_rate: share of requests answered with a 503.
+        :param model: model name reported in the responses.
+        :param seed: seed of the error-rate random generator.
+        """
+        self.latency = latency
+        self.token_rate = token_rate
+        self.prompt_token_rate = prompt_token_rate
+        self.error_rate = error_rate
+        self.model = model
+        self.requests = 0
+        self.errors = 0
+
+        self._slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _classify(self, text, fields=None):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        confidence = round(0.5 + digest[2] / 510, 2)
+        answer = {
+            "sentiment": SENTIMENTS[digest[0] % len(SENTIMENTS)],
+            "label": LABELS[digest[1] % len(LABELS)],
+            "confidence": confidence,
+            "sentiment_confidence": confidence,
+            "label_confidence": confidence,
+            "reason": "the comment praises the service and the mobile app of the bank",
+        }
+        if fields is not None:
+            answer = {name: value for name, value in answer.items() if name in fields}
+        return answer
+
+    @staticmethod
+    def _schema_fields(response_format):
+        # answer fields allowed by a JSON schema format (of one item for batched requests)
+        if not isinstance(response_format, dict):
+            return None
+        properties = response_format.get("properties") or {}
+        results = properties.get("results")
+        if isinstance(results, dict) and isinstance(results.get("items"), dict):
+            properties = results["items"].get("properties") or {}
+        return set(properties) or None
+
+    def _content(self, messages, fields=None):
+        system_prompt = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        if "BATCH MODE" in system_prompt:
+            try:
+                items = json.loads(user)
+            except ValueError:
+                items = []
+            results = [dict(self._classify(str(item.get("text", "")), fields), id=item.get("id")) for item in items]
+            return json.dumps({"results": results}, ensure_ascii=False)
+        return json.dumps(self._classify(user, fields), ensure_ascii=False)
+
+    def answer(self, request, openai=False):
+        """
+        Build the (status, body) of one chat request, sleeping for its simulated
+        service time first.
+        """
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if failed:
+            return 503, {"error": "server busy"}
+
+        messages = request.get("messages") or []
+        content = self._content(messages, self._schema_fields(request.get("format")))
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        eval_tokens = estimate_tokens(content)
+        done_reason = "stop"
+        num_predict = (request.get("options") or {}).get("num_predict")
+        if num_predict and eval_tokens > num_predict:
+            content = content[:num_predict * 4]
+            eval_tokens = num_predict
+            done_reason = "length"
+        prompt_seconds = prompt_tokens / self.prompt_token_rate if self.prompt_token_rate else 0.0
+        eval_seconds = eval_tokens / self.token_rate if self.token_rate else 0.0
+
+        start = time.perf_counter()
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            time.sleep(self.latency + prompt_seconds + eval_seconds)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+        total_ns = int((time.perf_counter() - start) * 1e9)
+
+        if openai:
+            return 200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": self.model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": done_reason}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": eval_tokens,
+                          "total_tokens": prompt_tokens + eval_tokens},
+            }
+        return 200, {
+            "model": self.model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "done_reason": done_reason,
+            "total_duration": total_ns,
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="fixed seconds per request")
+    parser.add_argument("--token-rate", type=float, default=None, help="generated tokens/sec")
+    parser.add_argument("--prompt-token-rate", type=float, default=None, help="prompt tokens/sec")
+    parser.add_argument("--parallel", type=int, default=None, help="requests served at once")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 answers")
+    args = parser.parse_args()
+
+    server = StubOllamaServer(args.host, args.port, args.latency, args.token_rate, args.prompt_token_rate,
+                              args.parallel, args.error_rate)
+    print(f"Stub Ollama listening on {server.url}")
+    with server:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Synthetic Arabic/English/emoji comments shaped like the social-media exports
+the pipeline classifies.
+"""
+import csv
+import random
+
+import pandas as pd
+
+
+WORDS = [
+    "مبروك", "الله", "يعطيكم", "العافية", "الخدمة", "سيئة", "ممتازة", "التطبيق", "البطاقة", "قرض",
+    "great", "service", "app", "not", "working", "thanks", "loan", "card", "please", "help",
+]
+EMOJIS = ["😍", "❤️", "👏", "😘", "🔥", "🌹", "👍", "🙏", "👌", "😡", "👨‍👩‍👧"]
+EXTRAS = ["@some.user", "@bank_support", "https://t.co/abc123", "www.example.com", "\n", "‏", "!!", "؟"]
+
+
+def synthetic_comments(rows, unique_ratio=0.3, seed=0):
+    """
+    :param rows: number of comments.
+    :param unique_ratio: share of distinct comments: int(rows * unique_ratio)
+                         distinct texts each appear at least once, the other
+                         rows repeat random ones (1.0 = every row distinct).
+    :param seed: random seed, so every run sees the same data.
+    :return: pandas Series of object dtype.
+    """
+    rnd = random.Random(seed)
+    n_unique = min(rows, max(1, int(rows * unique_ratio)))
+    uniques = {}
+    while len(uniques) < n_unique:
+        parts = rnd.choices(WORDS, k=rnd.randint(1, 12))
+        parts += rnd.choices(EMOJIS, k=rnd.randint(0, 3))
+        parts += rnd.choices(EXTRAS, k=rnd.randint(0, 2))
+        rnd.shuffle(parts)
+        uniques[" ".join(parts)] = None
+    uniques = list(uniques)
+    comments = uniques + rnd.choices(uniques, k=rows - n_unique)
+    rnd.shuffle(comments)
+    return pd.Series(comments, dtype=object)
+
+
+def synthetic_frame(rows, unique_ratio=0.3, seed=0, numeric_ids=False):
+    """
+    :param numeric_ids: numeric Comment_pk values, as in the database exports.
+    :return: DataFrame with the Comment_pk/Comment_text columns of the comments export
+             plus a few metadata columns.
+    """
+    rnd = random.Random(seed + 1)
+    return pd.DataFrame({
+        "Comment_pk": [str(1_000_000_000 + i) if numeric_ids else f"c{i:09d}" for i in range(rows)],
+        "Post_pk": [f"p{rnd.randint(0, max(1, rows // 50)):07d}" for _ in range(rows)],
+        "Comment_text": synthetic_comments(rows, unique_ratio, seed),
+        "Likes": [str(rnd.randint(0, 5000)) for _ in range(rows)],
+        "Created_at": [f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}" for _ in range(rows)],
+    })
+
+
+def write_synthetic_csv(path, rows, sep="¦", unique_ratio=0.3, seed=0, multiline=True, numeric_ids=False):
+    """
+    Write synthetic_frame(rows) as a CSV with the `sep` delimiter of the raw exports.
+
+    :param multiline: keep the newlines inside comments (quoted fields spanning
+                      several lines); False replaces them with spaces.
+    :param numeric_ids: see synthetic_frame().
+    :return: size of the file in bytes.
+    """
+    df = synthetic_frame(rows, unique_ratio, seed, numeric_ids)
+    if not multiline:
+        df["Comment_text"] = df["Comment_text"].str.replace("\n", " ", regex=False)
+    df.to_csv(path, sep=sep, index=False, quoting=csv.QUOTE_MINIMAL)
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        return f.tell()
@@ -0,0 +1,112 @@
+import json
+
+
+# Placeholder put in the user message while the request body is serialized
+_USER_TEXT_MARKER = "@@USER_TEXT@@"
+
+# Model options that change speed or memory use but not the answer; left out of cache keys
+RUNTIME_OPTIONS = {"num_ctx", "num_batch", "num_gpu", "num_thread", "use_mmap", "use_mlock"}
+
+# Sentiment prompt of the batch pipeline, kept here so the Lambda (which ships
+# only this module) sends the same one
+SA_SYSTEM_PROMPT = "You are a precise sentiment classifier.\n\nTASK Classify the TEXT into exactly one label from LABELS.\n\nRULES\n\nChoose the single best label (no ties).\nPrefer \"Neutral\" if ambiguous (only if present).\nConsider negation, sarcasm, contrast.\nOutput MUST be one JSON object. No extra text.\nFORMAT { \"sentiment\": \"<one of the labels>\", \"confidence\": <0..1>, \"reason\": \"<max 20 words>\" }\n\nLABELS{Positive, Neutral, Negative}\n\nGUIDANCE\n\nText may be English or Arabic (or mixed).\nEmojis are sentiment clues (😍❤️👏😘🔥🌹👍🙏👌 often positive) but context dominates.\nComplaints about expensive/unreasonable prices → negative unless clearly negated.\n When you see TEXT:, classify it using the rules above. Respond ONLY with the JSON object and nothing else.\nTEXT"
+
+
+class ChatTask:
+    """
+    One chat task (system prompt, model, response format and model options)
+    with its request body serialized once.
+
+    payload(text) only JSON-encodes the user message and splices it between
+    the pre-serialized halves of the body, instead of re-running json.dumps on
+    a payload holding the same multi-kilobyte system prompt for every call.
+
+    keep_alive and options are Ollama /api/chat fields: keep_alive (e.g. "30m",
+    or -1 for forever) keeps the model loaded between bursts of requests, and
+    options carries num_ctx, temperature, ... Every task sent to one server
+    should use the same num_ctx, since a different context size makes Ollama
+    reload the model. The OpenAI compatible /v1/chat/completions endpoint
+    ignores both; set OLLAMA_KEEP_ALIVE on the server for it instead.
+    """
+
+    def __init__(self, name, system_prompt, model, response_format=None, options=None, keep_alive=None,
+                 stream=False, user_template="TEXT:{text}", extra=None):
+        """
+        :param name: task name, also used to label the request metrics.
+        :param system_prompt: system message of every request.
+        :param model: model name.
+        :param response_format: Ollama `format` (JSON schema or "json"), if any.
+        :param options: Ollama model options, e.g. {"num_ctx": 4096, "temperature": 0}.
+        :param keep_alive: how long Ollama keeps the model loaded after the request.
+        :param stream: value of the `stream` field.
+        :param user_template: user message, with {text} replaced by the text to classify.
+        :param extra: other top-level request fields, e.g. {"temperature": 0.0} for an
+                      OpenAI compatible endpoint.
+        """
+        self.name = name
+        self.system_prompt = system_prompt
+        self.model = model
+        self.response_format = response_format
+        self.options = dict(options) if options else {}
+        self.keep_alive = keep_alive
+        self.stream = stream
+        self.user_template = user_template
+        self.extra = dict(extra) if extra else {}
+
+        body = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": _USER_TEXT_MARKER},
+            ],
+            "stream": stream,
+        }
+        if response_format is not None:
+            body["format"] = response_format
+        if self.options:
+            body["options"] = self.options
+        if keep_alive is not None:
+            body["keep_alive"] = keep_alive
+        body.update(self.extra)
+
+        serialized = json.dumps(body)
+        marker = json.dumps(_USER_TEXT_MARKER)
+        if serialized.count(marker) != 1:
+            raise ValueError(f"Task '{name}' must not contain the placeholder {_USER_TEXT_MARKER}")
+        self._prefix, self._suffix = serialized.split(marker)
+
+    def payload(self, text):
+        """Request body (JSON str) for one text."""
+        return self._prefix + json.dumps(self.user_template.format(text=text)) + self._suffix
+
+    def derive(self, **changes):
+        """A copy of this task with some constructor arguments changed."""
+        arguments = {
+            "name": self.name,
+            "system_prompt": self.system_prompt,
+            "model": self.model,
+            "response_format": self.response_format,
+            "options": self.options,
+            "keep_alive": self.keep_alive,
+            "stream": self.stream,
+            "user_template": self.user_template,
+            "extra": self.extra,
+        }
+        arguments.update(changes)
+        return ChatTask(**arguments)
+
+    @property
+    def cache_options(self):
+        """Request fields besides the prompt and model that change the answer (for cache keys)."""
+        cache_options = {}
+        if self.response_format is not None:
+            cache_options["format"] = self.response_format
+        answer_options = {k: v for k, v in self.options.items() if k not in RUNTIME_OPTIONS}
+        if answer_options:
+            cache_options["options"] = answer_options
+        if self.extra:
+            cache_options["extra"] = self.extra
+        return cache_options or None
+
+    def __repr__(self):
+        return f"ChatTask({self.name!r}, model={self.model!r})"
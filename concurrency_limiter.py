@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+
+
+class AIMDConcurrencyLimiter:
+    """
+    Adaptive limit on the number of in-flight LLM requests (additive increase,
+    multiplicative decrease).
+
+    Every 2xx answer whose smoothed latency stays close to the best recent
+    latency adds 1/limit to the limit, so it grows by about one per round trip.
+    The limit is multiplied by `backoff` when the server answers 429/5xx, the
+    request fails, or the smoothed latency climbs above `latency_tolerance` times
+    the best recent latency (requests are queueing inside Ollama). Decreases
+    happen at most once per smoothed round trip, so one burst of errors doesn't
+    collapse the limit to the minimum. Other statuses (404, ...) leave the limit
+    and the latencies alone.
+
+    Latencies are tracked per `key` (the task), since a short sentiment call and
+    a long categorization call have different normal latencies. The best recent
+    latency is the minimum over the current and the previous `baseline_window`
+    seconds: one unusually fast answer stops counting after two windows, while
+    a queue has a full window to show up against the unloaded latency.
+
+    Works from worker threads (acquire/release) and from one asyncio event loop
+    (acquire_async/release_async).
+    """
+
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=100, backoff=0.75, latency_tolerance=2.0, smoothing=0.1,
+                 baseline_window=120.0):
+        """
+        :param initial_limit: in-flight requests allowed at the start.
+        :param min_limit: the limit never goes below this.
+        :param max_limit: the limit never goes above this; also the thread pool size.
+        :param backoff: factor applied to the limit on overload.
+        :param latency_tolerance: overload when smoothed latency > tolerance * best recent latency.
+        :param smoothing: weight of the newest sample in the latency moving average.
+        :param baseline_window: seconds after which the best latency seen starts to expire.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_window = baseline_window
+
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        # key -> {"smoothed", "window_min", "previous_min", "window_start"}
+        self._latencies = {}
+        self.increases = 0
+        self.decreases = 0
+
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_cond = None
+        self._async_loop = None
+
+    @property
+    def current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    def _has_slot(self):
+        with self._cond:
+            return self.in_flight < self.current_limit
+
+    def acquire(self):
+        """Block the calling thread until a request slot is free, then take it."""
+        with self._cond:
+            while self.in_flight >= self.current_limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, status=None, error=False, key=None):
+        """
+        Give the slot back and adapt the limit.
+
+        :param latency: request wall time in seconds (None if it failed early).
+        :param status: HTTP status code of the response, if any.
+        :param error: True if the request raised (connection error, timeout, ...).
+        :param key: kind of request (e.g. the task name) whose latencies it is compared with.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._update(latency, status, error, key)
+            self._cond.notify_all()
+
+    def _get_async_condition(self):
+        # asyncio primitives are bound to one loop; make a new one for every asyncio.run
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_loop = loop
+            self._async_cond = asyncio.Condition()
+        return self._async_cond
+
+    async def acquire_async(self):
+        """Wait on the event loop until a request slot is free, then take it."""
+        cond = self._get_async_condition()
+        async with cond:
+            await cond.wait_for(self._has_slot)
+            with self._cond:
+                self.in_flight += 1
+
+    async def release_async(self, latency=None, status=None, error=False, key=None):
+        """Async counterpart of release."""
+        with self._cond:
+            self.in_flight -= 1
+            self._update(latency, status, error, key)
+        cond = self._get_async_condition()
+        async with cond:
+            cond.notify_all()
+
+    def _observe(self, key, latency, now):
+        # update the latency state of `key`, return (smoothed, best recent) latency
+        state = self._latencies.get(key)
+        if state is None:
+            state = self._latencies[key] = {"smoothed": latency, "window_min": latency, "previous_min": latency,
+                                            "window_start": now}
+        else:
+            state["smoothed"] += self.smoothing * (latency - state["smoothed"])
+            if now - state["window_start"] >= self.baseline_window:
+                state["previous_min"] = state["window_min"]
+                state["window_min"] = latency
+                state["window_start"] = now
+            else:
+                state["window_min"] = min(state["window_min"], latency)
+        return state["smoothed"], min(state["window_min"], state["previous_min"])
+
+    def _update(self, latency, status, error, key=None):
+        now = time.monotonic()
+        overloaded = error or status == 429 or (status is not None and status >= 500)
+        state = self._latencies.get(key)
+        smoothed = state["smoothed"] if state else None
+        if not overloaded:
+            if latency is None or status is None or not 200 <= status < 300:
+                return
+            smoothed, best = self._observe(key, latency, now)
+            overloaded = smoothed > self.latency_tolerance * best
+
+        if overloaded:
+            if now - self._last_decrease >= (smoothed or 0.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+                self.decreases += 1
+        elif self.limit < self.max_limit:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.increases += 1
+
+    def stats(self):
+        """
+        :return: dict with the current limit, in-flight count, latency estimates
+                 per key and how often the limit went up or down.
+        """
+        with self._cond:
+            return {
+                "limit": self.current_limit,
+                "in_flight": self.in_flight,
+                "min_latency": {key: min(state["window_min"], state["previous_min"])
+                                for key, state in self._latencies.items()},
+                "smoothed_latency": {key: state["smoothed"] for key, state in self._latencies.items()},
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
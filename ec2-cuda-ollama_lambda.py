@@ -1,12 +1,32 @@
 import json
 import os
+import random
 import requests
 
+from chat_tasks import SA_SYSTEM_PROMPT, ChatTask
+
 # You can override these in Lambda environment variables if you like
 LLM_URL = os.environ.get("LLM_URL", "http://50.16.5.200:8080/v1/chat/completions")
+# Optional comma-separated list of equivalent backends; tried in random order
+LLM_URLS = [url for url in os.environ.get("LLM_URLS", LLM_URL).split(",") if url]
 LLM_MODEL = os.environ.get("LLM_MODEL", "yasserrmd/ALLaM-7B-Instruct-preview")
 LLM_API_KEY = os.environ.get("LLM_API_KEY", "demo")
 
+# Serialized once per container; each invocation only splices in its text.
+# chat_tasks.py has to be packaged next to this file. The OpenAI compatible
+# endpoint ignores keep_alive and num_ctx, so set them on the EC2 server
+# instead (OLLAMA_KEEP_ALIVE=30m OLLAMA_CONTEXT_LENGTH=4096 ollama serve).
+SENTIMENT_TASK = ChatTask(
+    "sentiment",
+    SA_SYSTEM_PROMPT,
+    LLM_MODEL,
+    stream=True,  # keep same as your original code
+)
+HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {LLM_API_KEY}",
+}
+
 
 def lambda_handler(event, context):
     """
@@ -27,63 +47,36 @@ def lambda_handler(event, context):
             "headers": {"Content-Type": "application/json"},
         }
 
-    # System prompt (same as your original code)
-    system_prompt = (
-        "You are a precise sentiment classifier.\n\n"
-        "TASK Classify the TEXT into exactly one label from LABELS.\n\n"
-        "RULES\n\n"
-        "Choose the single best label (no ties).\n"
-        "Prefer \"Neutral\" if ambiguous (only if present).\n"
-        "Consider negation, sarcasm, contrast.\n"
-        "Output MUST be one JSON object. No extra text.\n"
-        "FORMAT { \"sentiment\": \"<one of the labels>\", \"confidence\": <0..1>, \"reason\": \"<max 20 words>\" }\n\n"
-        "LABELS{Positive, Neutral, Negative}\n\n"
-        "GUIDANCE\n\n"
-        "Text may be English or Arabic (or mixed).\n"
-        "Emojis are sentiment clues (😍❤️👏😘🔥🌹👍🙏👌 often positive) but context dominates.\n"
-        "Complaints about expensive/unreasonable prices → negative unless clearly negated.\n"
-        "TEXT"
-    )
-
-    # Build payload (same structure as your script, but user text comes from event)
-    payload = {
-        "model": LLM_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": system_prompt,
-            },
-            {
-                "role": "user",
-                "content": text,
-            },
-        ],
-        "stream": True,  # keep same as your original code
-    }
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {LLM_API_KEY}",
-    }
-
-    try:
-        response = requests.post(
-            LLM_URL,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=30,
-        )
+    # Spread invocations over the backends and fail over to the next one
+    # on connection errors or 5xx answers
+    urls = random.sample(LLM_URLS, len(LLM_URLS))
+    body = SENTIMENT_TASK.payload(text)
+    response = None
+    error = None
+    for url in urls:
+        try:
+            response = requests.post(
+                url,
+                headers=HEADERS,
+                data=body,
+                timeout=30,
+            )
+        except Exception as e:
+            error = e
+            continue
+        if response.status_code < 500:
+            break
 
-        # Return raw text back to the caller (you can parse it if you want)
-        return {
-            "statusCode": response.status_code,
-            "body": response.text,
-            "headers": {"Content-Type": "application/json"},
-        }
-
-    except Exception as e:
+    if response is None:
         return {
             "statusCode": 500,
-            "body": json.dumps({"error": str(e)}),
+            "body": json.dumps({"error": str(error)}),
             "headers": {"Content-Type": "application/json"},
         }
+
+    # Return raw text back to the caller (you can parse it if you want)
+    return {
+        "statusCode": response.status_code,
+        "body": response.text,
+        "headers": {"Content-Type": "application/json"},
+    }
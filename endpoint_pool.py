@@ -0,0 +1,135 @@
+import random
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+
+class EndpointPool:
+    """
+    A set of equivalent chat endpoints (one per Ollama/EC2 backend) with
+    least-outstanding-requests routing.
+
+    acquire() hands out the healthy endpoint with the fewest requests in flight
+    (ties broken at random) and release() gives it back. An endpoint is ejected
+    after `failure_threshold` consecutive failed requests (connection errors or
+    5xx) or a failed health check. A background thread probes every endpoint
+    each `health_check_interval` seconds and re-admits ejected ones as soon as
+    their probe succeeds. If every endpoint is ejected, requests still go to the
+    least loaded one rather than failing outright.
+    """
+
+    def __init__(self, urls, health_check_interval=10.0, failure_threshold=3, health_path="/api/tags",
+                 health_timeout=2.0, headers=None):
+        """
+        :param urls: chat URLs, e.g. ["http://10.0.0.5:8080/api/chat", ...].
+        :param health_check_interval: seconds between health-check rounds.
+        :param failure_threshold: consecutive request failures before ejecting an endpoint.
+        :param health_path: path probed with GET on each endpoint's host.
+        :param health_timeout: timeout of one probe in seconds.
+        :param headers: headers sent with the probes (e.g. the proxy's Authorization).
+        """
+        if not urls:
+            raise ValueError("EndpointPool needs at least one URL")
+        self.urls = list(urls)
+        self.health_check_interval = health_check_interval
+        self.failure_threshold = failure_threshold
+        self.health_path = health_path
+        self.health_timeout = health_timeout
+        self.headers = headers or {}
+
+        self.outstanding = {url: 0 for url in self.urls}
+        self.healthy = {url: True for url in self.urls}
+        self.failures = {url: 0 for url in self.urls}
+        self.served = {url: 0 for url in self.urls}
+        self.ejections = 0
+        self.readmissions = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        """Pick the endpoint for the next request and count it as outstanding."""
+        with self._lock:
+            candidates = [url for url in self.urls if self.healthy[url]] or self.urls
+            fewest = min(self.outstanding[url] for url in candidates)
+            url = random.choice([url for url in candidates if self.outstanding[url] == fewest])
+            self.outstanding[url] += 1
+            self.served[url] += 1
+            return url
+
+    def release(self, url, ok=True):
+        """
+        Finish a request started with acquire().
+
+        :param ok: False for a connection error/timeout or a 5xx answer, None for
+                   a request abandoned by the caller (a hedge that lost), which
+                   says nothing about the endpoint's health.
+        """
+        with self._lock:
+            self.outstanding[url] -= 1
+            if ok is None:
+                return
+            if ok:
+                self.failures[url] = 0
+                return
+            self.failures[url] += 1
+            if self.failures[url] >= self.failure_threshold:
+                self._mark_locked(url, False)
+
+    def _mark_locked(self, url, healthy):
+        if self.healthy[url] and not healthy:
+            self.ejections += 1
+            print(f"Endpoint ejected: {url}")
+        elif not self.healthy[url] and healthy:
+            self.readmissions += 1
+            self.failures[url] = 0
+            print(f"Endpoint re-admitted: {url}")
+        self.healthy[url] = healthy
+
+    def health_url(self, url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}{self.health_path}"
+
+    def check(self, url):
+        """Probe one endpoint now and update its health. Returns True if it answered 2xx."""
+        try:
+            ok = requests.get(self.health_url(url), headers=self.headers, timeout=self.health_timeout).ok
+        except requests.RequestException:
+            ok = False
+        with self._lock:
+            self._mark_locked(url, ok)
+        return ok
+
+    def check_all(self):
+        for url in self.urls:
+            self.check(url)
+
+    def _run(self):
+        while not self._stop.wait(self.health_check_interval):
+            self.check_all()
+
+    def start(self):
+        """Start the background health-check thread (daemon)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="endpoint-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """
+        :return: dict url -> {"healthy", "outstanding", "served"}.
+        """
+        with self._lock:
+            return {
+                url: {"healthy": self.healthy[url], "outstanding": self.outstanding[url], "served": self.served[url]}
+                for url in self.urls
+            }
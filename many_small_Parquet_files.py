@@ -1,24 +1,112 @@
+import mmap
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 import pyarrow as pa
+import pyarrow.csv as pa_csv
 import pyarrow.parquet as pq
 
+from Chunked_Pandas_to_Parquet import arrow_csv_options, layout_schema, read_csv_header, replace_delimiter, restore_delimiter
+from parquet_layout import ParquetLayout, apply_schema
+
+# Bytes scanned at a time when counting quotes between two record boundaries
+_SCAN_BYTES = 16 * 1024 * 1024
+
+
+def _count_quotes(mm, start, end):
+    count = 0
+    for offset in range(start, end, _SCAN_BYTES):
+        count += mm[offset:min(end, offset + _SCAN_BYTES)].count(b'"')
+    return count
+
+
+def _next_record_start(mm, pos, in_quotes):
+    """
+    First offset at or after `pos` that starts a record: just past a newline
+    that is outside quotes. `in_quotes` is the quote state at `pos`. Quoting is
+    tracked by quote-count parity, which holds for RFC 4180 CSV ("" escapes
+    inside quoted fields, as written by pandas/arrow). Returns len(mm) at EOF.
+    """
+    while True:
+        newline = mm.find(b"\n", pos)
+        if newline == -1:
+            return len(mm)
+        in_quotes ^= _count_quotes(mm, pos, newline) % 2 == 1
+        pos = newline + 1
+        if not in_quotes:
+            return pos
+
+
+def record_aligned_ranges(input_path: str, max_bytes: int):
+    """
+    Split the data records of a CSV (everything after the header) into byte
+    ranges of about `max_bytes` that start and end on record boundaries, so a
+    newline inside a quoted field never splits a record.
+
+    Returns (header_end, [(start, end), ...]).
+    """
+    with open(input_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        header_end = _next_record_start(mm, 0, False)
+        ranges = []
+        start = header_end
+        while start < size:
+            target = min(size, start + max_bytes)
+            # quote state at `target`, from the record start (outside quotes)
+            in_quotes = _count_quotes(mm, start, target) % 2 == 1
+            end = _next_record_start(mm, target, in_quotes) if target < size else size
+            ranges.append((start, end))
+            start = end
+    return header_end, ranges
+
+
+def _convert_byte_range(input_path, start, end, column_names, sep, parquet_path, schema, layout):
+    # worker process: parse one record-aligned range of the mapped file with arrow
+    with open(input_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = replace_delimiter(mm[start:end], sep)
+    options = arrow_csv_options(column_names, sep, has_header=False)
+    options["read_options"].use_threads = False  # the pool already uses every core
+    table = restore_delimiter(pa_csv.read_csv(pa.py_buffer(data), **options), sep)
+    table = apply_schema(table, schema)
+    pq.write_table(table, parquet_path, row_group_size=layout.row_group_size, **layout.writer_options())
+    return parquet_path, table.num_rows
+
+
 def split_csv_and_convert_to_parquet(
     input_path: str,
     output_prefix: str,
     sep: str = "¦",
     max_csv_mb: int = 80,      # target max size per temp CSV chunk
-    delete_temp_csv: bool = True
+    delete_temp_csv: bool = True,
+    mode: str = "byte_ranges",
+    max_workers: int = None,
+    layout: ParquetLayout = None,
 ):
     """
-    1) Split a large CSV into smaller CSV files (by size).
-    2) Convert each small CSV into a Parquet file (Snappy, all columns as string).
+    Convert a large CSV into Parquet parts (Snappy, all columns as string, or
+    the types and writer settings of `layout`), one part per ~max_csv_mb of CSV.
+
+    - mode="byte_ranges": memory-map the input, cut it into record-aligned
+      byte ranges (quote-aware, so a newline inside a quoted field never splits
+      a record) and convert every range to its own Parquet part with arrow in a
+      process pool of `max_workers` (default: all cores). No temp CSV files.
+    - mode="split": 1) split the CSV into smaller CSV files (by size), 2)
+      convert each small CSV with pandas, one after the other.
 
-    - max_csv_mb: size of each CSV chunk on disk (Parquet will usually be < 100MB).
+    - max_csv_mb: size of each CSV chunk/range (Parquet will usually be < 100MB).
     - output_prefix: base name for chunk files, e.g., 'bigfile' -> bigfile_part0001.parquet
     """
 
     max_bytes = max_csv_mb * 1024 * 1024
+    layout = layout or ParquetLayout()
+
+    if mode == "byte_ranges":
+        return _convert_byte_ranges_to_parquet(input_path, output_prefix, sep, max_bytes, max_workers, layout)
+    if mode != "split":
+        raise ValueError(f"Unknown mode '{mode}', expected 'byte_ranges' or 'split'")
+    schema = layout_schema(input_path, read_csv_header(input_path, sep), sep, layout)
+
     part_index = 1
     temp_files = []
 
@@ -91,11 +179,13 @@ def split_csv_and_convert_to_parquet(
             [(name, pa.string()) for name in table.column_names]
         )
         table = table.cast(string_schema)
+        table = apply_schema(table, schema)
 
         pq.write_table(
             table,
             parquet_path,
-            compression="snappy"
+            row_group_size=layout.row_group_size,
+            **layout.writer_options()
         )
 
         size_mb = os.path.getsize(parquet_path) / (1024 * 1024)
@@ -111,6 +201,51 @@ def split_csv_and_convert_to_parquet(
 
     return parquet_files
 
+
+def _convert_byte_ranges_to_parquet(input_path, output_prefix, sep, max_bytes, max_workers, layout):
+    column_names = read_csv_header(input_path, sep)
+    schema = layout_schema(input_path, column_names, sep, layout)
+    _, ranges = record_aligned_ranges(input_path, max_bytes)
+    if not ranges:
+        raise ValueError("Input CSV has no data rows.")
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(ranges))
+    print(f"Converting '{input_path}' as {len(ranges)} byte range(s) of "
+          f"~{max_bytes / (1024*1024):.0f}MB with {max_workers} worker(s)...")
+
+    part_prefix = os.path.basename(output_prefix)
+    parquet_files = [f"{part_prefix}_part{index:04d}.parquet" for index in range(1, len(ranges) + 1)]
+
+    total_rows = 0
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_convert_byte_range, input_path, start, end, column_names, sep, parquet_path, schema, layout)
+                for (start, end), parquet_path in zip(ranges, parquet_files)
+            ]
+            try:
+                for future in as_completed(futures):
+                    parquet_path, rows = future.result()
+                    total_rows += rows
+                    size_mb = os.path.getsize(parquet_path) / (1024 * 1024)
+                    print(f"  -> {parquet_path}: {rows:,} rows, {size_mb:.2f} MB")
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+    except BaseException:
+        # the parts of the other ranges would read as a complete, smaller output
+        for f in parquet_files:
+            if os.path.exists(f):
+                os.remove(f)
+        raise
+
+    print(f"\n✅ Done! {total_rows:,} rows in the following Parquet files:")
+    for f in parquet_files:
+        print(f"  - {f} ({os.path.getsize(f) / (1024*1024):.2f} MB)")
+
+    return parquet_files
+
+
 if __name__ == "__main__":
 # Example usage:
     split_csv_and_convert_to_parquet("sample_5gb.csv", "bfile", max_csv_mb=100)
@@ -3,6 +3,16 @@ import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
 
+from Chunked_Pandas_to_Parquet import (_discard_parquet, layout_schema, open_csv_string_batches, prefetch_batches,
+                                       read_csv_header, restore_delimiter)
+from parquet_layout import ParquetLayout, apply_schema
+
+# Bytes kept free in every rolling part for the Parquet footer (at most 1/32 of max_mb)
+FOOTER_RESERVE_BYTES = 256 * 1024
+# Largest share of max_mb written per write call (one row group), so the
+# last row groups of a part can be sized to the room left
+ROW_GROUP_SHARE = 1 / 8
+
 
 def split_csv_and_convert_to_packed_parquet(
     input_path: str,
@@ -11,8 +21,22 @@ def split_csv_and_convert_to_packed_parquet(
     max_mb: int = 100,
     delete_temp_csv: bool = True,
     delete_temp_parquet: bool = True,
+    mode: str = "rolling",
+    block_size_mb: int = 64,
+    layout: ParquetLayout = None,
 ):
     """
+    Convert a large CSV into as few Parquet files (Snappy, all columns as
+    string, or the types and writer settings of `layout`) as possible, each
+    <= max_mb (compressed size).
+
+    mode="rolling" (one pass, no temp files): stream record batches from the
+    CSV with arrow and write them to one open ParquetWriter while tracking the
+    compressed bytes written. Every write is sized from the compression ratio
+    seen so far to fit the room left, and the writer rolls to a new file just
+    before max_mb.
+
+    mode="split":
     1) Split a large CSV into smaller CSV files by size (max_mb each, approx).
     2) Convert each small CSV into a Parquet file (Snappy, all columns as string).
     3) Merge small Parquet files into larger final Parquet parts such that:
@@ -23,6 +47,13 @@ def split_csv_and_convert_to_packed_parquet(
     """
 
     max_bytes = max_mb * 1024 * 1024
+    layout = layout or ParquetLayout()
+
+    if mode == "rolling":
+        return _write_rolling_parquet(input_path, output_prefix, sep, max_bytes, block_size_mb, layout)
+    if mode != "split":
+        raise ValueError(f"Unknown mode '{mode}', expected 'rolling' or 'split'")
+    schema = layout_schema(input_path, read_csv_header(input_path, sep), sep, layout)
 
     # ---------- STEP 1: Split big CSV into smaller CSV files ----------
     print(f"Splitting '{input_path}' into ~{max_mb}MB CSV chunks...")
@@ -93,11 +124,13 @@ def split_csv_and_convert_to_packed_parquet(
             )
 
         table = table.cast(string_schema)
+        table = apply_schema(table, schema)
 
         pq.write_table(
             table,
             parquet_path,
-            compression="snappy"
+            row_group_size=layout.row_group_size,
+            **layout.writer_options()
         )
 
         size_mb = os.path.getsize(parquet_path) / (1024 * 1024)
@@ -137,24 +170,22 @@ def split_csv_and_convert_to_packed_parquet(
 
     # 3.3: Merge each group into a final Parquet file
     final_parquet_files = []
-    for idx, group in enumerate(groups, start=1):
-        final_path = f"{output_prefix}_final_part{idx:04d}.parquet"
-        print(f"\nMerging group {idx} -> {final_path} ...")
+    try:
+        for idx, group in enumerate(groups, start=1):
+            final_path = f"{output_prefix}_final_part{idx:04d}.parquet"
+            print(f"\nMerging group {idx} -> {final_path} ...")
 
-        tables = []
-        for pfile in group["files"]:
-            t = pq.read_table(pfile)
-            if string_schema is not None:
-                t = t.cast(string_schema)
-            tables.append(t)
+            _merge_parquet_files(group["files"], final_path, schema, layout)
 
-        combined = pa.concat_tables(tables, promote=True)
-        pq.write_table(combined, final_path, compression="snappy")
+            size_mb = os.path.getsize(final_path) / (1024 * 1024)
+            print(f"  -> Final Parquet size: {size_mb:.2f} MB")
 
-        size_mb = os.path.getsize(final_path) / (1024 * 1024)
-        print(f"  -> Final Parquet size: {size_mb:.2f} MB")
-
-        final_parquet_files.append(final_path)
+            final_parquet_files.append(final_path)
+    except BaseException:
+        # the parts merged so far would read as a complete, smaller output
+        for f in final_parquet_files:
+            os.remove(f)
+        raise
 
     if delete_temp_parquet:
         for p in temp_parquet_files:
@@ -167,6 +198,148 @@ def split_csv_and_convert_to_packed_parquet(
     return final_parquet_files
 
 
+def _merge_parquet_files(paths, output_path, schema=None, layout=None):
+    """
+    Append the row groups of `paths` one at a time to a single ParquetWriter,
+    so memory stays at one decompressed row group whatever the number of files.
+    Row groups already in `schema` are written as read, without a cast. On an
+    error the partly written `output_path` is deleted.
+    """
+    layout = layout or ParquetLayout()
+    writer = None
+    try:
+        for path in paths:
+            source = pq.ParquetFile(path)
+            for index in range(source.num_row_groups):
+                table = source.read_row_group(index)
+                if schema is not None and not table.schema.equals(schema):
+                    table = table.cast(schema)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, schema or table.schema, **layout.writer_options())
+                writer.write_table(table, row_group_size=layout.row_group_size)
+            source.close()
+    except BaseException:
+        _discard_parquet(writer, output_path)
+        raise
+    if writer is not None:
+        writer.close()
+
+
+class _RollingParquetWriter:
+    """
+    Writes record batches to {output_prefix}_final_partNNNN.parquet files,
+    starting a new file whenever the next rows would push the current one
+    past `max_bytes`. Sizes come from the output stream position after every
+    write (row groups are flushed as they are written). The first row group of
+    every batch is sized as if it did not compress at all, the next ones by the
+    ratio it got, so a block that compresses worse than the previous ones can't
+    overshoot. discard() removes every part of a conversion that failed midway.
+    """
+
+    def __init__(self, output_prefix, schema, max_bytes, layout=None):
+        self.output_prefix = output_prefix
+        self.schema = schema
+        self.max_bytes = max_bytes
+        self.layout = layout or ParquetLayout()
+        self.paths = []
+        self.rows = 0
+        self._sink = None
+        self._writer = None
+
+    def _open(self):
+        path = f"{self.output_prefix}_final_part{len(self.paths) + 1:04d}.parquet"
+        self._sink = pa.OSFile(path, "wb")
+        self._writer = pq.ParquetWriter(self._sink, self.schema, **self.layout.writer_options())
+        self.paths.append(path)
+        self.rows = 0
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            size_mb = os.path.getsize(self.paths[-1]) / (1024 * 1024)
+            print(f"  -> {self.paths[-1]}: {self.rows:,} rows, {size_mb:.2f} MB")
+            self._writer = None
+
+    def write_batch(self, batch):
+        if batch.num_rows == 0:
+            return
+        bytes_per_row = batch.nbytes / batch.num_rows
+        # compressed bytes per in-memory byte of this batch, once one piece is written
+        ratio = None
+        offset = 0
+        while offset < batch.num_rows:
+            if self._writer is None:
+                self._open()
+            room = self.max_bytes - min(FOOTER_RESERVE_BYTES, self.max_bytes / 32) - self._sink.tell()
+            budget = min(room, self.max_bytes * ROW_GROUP_SHARE)
+            # 10% margin on the measured ratio, it varies a little between row groups
+            row_bytes = bytes_per_row * (ratio * 1.1 if ratio is not None else 1.0)
+            rows = min(batch.num_rows - offset, int(budget / row_bytes))
+            if self.layout.row_group_size:
+                rows = min(rows, self.layout.row_group_size)
+            if rows <= 0 or room < self.max_bytes / 64:
+                if self.rows:
+                    self._close()
+                    continue
+                rows = max(rows, 1)  # a single row larger than max_bytes still has to go somewhere
+
+            piece = batch.slice(offset, rows)
+            before = self._sink.tell()
+            self._writer.write_batch(piece)
+            ratio = (self._sink.tell() - before) / (rows * bytes_per_row)
+            self.rows += rows
+            offset += rows
+
+    def close(self):
+        self._close()
+        return self.paths
+
+    def discard(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+                self._sink.close()
+            except Exception:
+                pass
+            self._writer = None
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.paths = []
+
+
+def _write_rolling_parquet(input_path, output_prefix, sep, max_bytes, block_size_mb, layout):
+    column_names = read_csv_header(input_path, sep)
+    schema = layout_schema(input_path, column_names, sep, layout)
+    print(f"Streaming '{input_path}' into Parquet files of ≤ {max_bytes / (1024*1024):.0f}MB...")
+
+    total_rows = 0
+    with open(input_path, "rb") as f:
+        reader = open_csv_string_batches(f, column_names, sep, block_size_mb)
+        writer = _RollingParquetWriter(output_prefix, schema, max_bytes, layout)
+        batches = prefetch_batches(reader)
+        try:
+            for batch in batches:
+                writer.write_batch(apply_schema(restore_delimiter(batch, sep), schema))
+                total_rows += batch.num_rows
+        except BaseException:
+            writer.discard()
+            raise
+        finally:
+            batches.close()
+        final_parquet_files = writer.close()
+
+    if total_rows == 0:
+        raise ValueError("Input CSV has no data rows.")
+
+    print(f"\n✅ Done! {total_rows:,} rows in the final Parquet files:")
+    for f in final_parquet_files:
+        print(f"  - {f} ({os.path.getsize(f) / (1024*1024):.2f} MB)")
+
+    return final_parquet_files
+
+
 # Example usage:
 # split_csv_and_convert_to_packed_parquet("bigfile.csv", "bigfile", max_mb=100)
 if __name__ == "__main__":
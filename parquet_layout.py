@@ -0,0 +1,152 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# Integers that round-trip through int64; IDs with leading zeros or a "+" stay strings
+INTEGER_PATTERN = r"^-?(0|[1-9][0-9]{0,18})$"
+DATE_PATTERN = r"^[0-9]{4}-[0-9]{2}-[0-9]{2}$"
+# Timestamp types tried in order: the first that parses every sampled value wins
+# (no seconds unit, Parquet stores those as milliseconds anyway)
+TIMESTAMP_TYPES = [pa.timestamp("ms"), pa.timestamp("us"), pa.timestamp("ms", tz="UTC"), pa.timestamp("us", tz="UTC")]
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+def _parses_as(values, type_):
+    try:
+        pc.cast(values, type_)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return False
+    return True
+
+
+def infer_column_type(column, dictionary_ratio=0.05, max_dictionary_values=50_000):
+    """
+    Narrowest type for one all-string sample column, ignoring empty values:
+    int64, date32 (YYYY-MM-DD), timestamp (ISO 8601, "Z"/offsets as UTC),
+    dictionary<int32, string> when at most `dictionary_ratio` of the values
+    (and no more than `max_dictionary_values`) are distinct, else string.
+    """
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    values = pc.filter(column, pc.not_equal(column, ""))
+    if len(values) == 0:
+        return pa.string()
+
+    if pc.all(pc.match_substring_regex(values, INTEGER_PATTERN)).as_py() and _parses_as(values, pa.int64()):
+        return pa.int64()
+    if pc.all(pc.match_substring_regex(values, DATE_PATTERN)).as_py() and _parses_as(values, pa.date32()):
+        return pa.date32()
+    if pc.all(pc.match_substring_regex(values, r"^[0-9]{4}-[0-9]{2}-[0-9]{2}[T ][0-9]")).as_py():
+        for type_ in TIMESTAMP_TYPES:
+            if _parses_as(values, type_):
+                return type_
+
+    distinct = pc.count_distinct(values).as_py()
+    if distinct <= max_dictionary_values and distinct <= dictionary_ratio * len(column):
+        return DICTIONARY_TYPE
+    return pa.string()
+
+
+def apply_schema(data, schema):
+    """
+    Cast an all-string Table/RecordBatch to `schema`. Empty strings become
+    nulls in the non-string columns.
+    """
+    if data.schema.equals(schema):
+        return data
+    columns = []
+    for field, column in zip(schema, data.columns):
+        if column.type != field.type:
+            if not pa.types.is_string(field.type) and not pa.types.is_dictionary(field.type):
+                column = pc.if_else(pc.equal(column, ""), pa.scalar(None, pa.string()), column)
+            try:
+                column = pc.cast(column, field.type)
+            except pa.ArrowInvalid as e:
+                raise ValueError(
+                    f"Column '{field.name}' has values that are not {field.type} past the sampled rows ({e}). "
+                    "Sample more rows or set its type in ParquetLayout(column_types=...)."
+                ) from e
+        columns.append(column)
+    return type(data).from_arrays(columns, schema=schema)
+
+
+class ParquetLayout:
+    """
+    How the CSV to Parquet converters lay out their output: column types and
+    the writer's codec, row-group size and statistics.
+
+    The default is the historical layout: every column as string, Snappy,
+    default row groups. typed=True infers the column types from the first
+    `sample_rows` rows (see infer_column_type): numeric IDs become int64,
+    dates/timestamps become date32/timestamp, low-cardinality strings become
+    dictionary columns (categoricals in pandas), the rest stays string.
+    """
+
+    def __init__(
+        self,
+        typed: bool = False,
+        sample_rows: int = 100_000,
+        dictionary_ratio: float = 0.05,
+        max_dictionary_values: int = 50_000,
+        column_types: dict = None,
+        compression: str = "snappy",
+        compression_level: int = None,
+        row_group_size: int = None,
+        write_statistics: bool = True,
+        write_page_index: bool = False,
+    ):
+        """
+        :param typed: infer column types instead of writing every column as string.
+        :param sample_rows: rows read to infer the types.
+        :param dictionary_ratio: largest distinct/rows ratio of a dictionary column.
+        :param max_dictionary_values: largest number of distinct values of a dictionary column.
+        :param column_types: {column: pyarrow type} overriding the inference (also with typed=False).
+        :param compression: Parquet codec: "snappy", "zstd", "gzip", "brotli", "lz4" or "none".
+        :param compression_level: codec level, e.g. 1-22 for zstd (None = codec default).
+        :param row_group_size: most rows per row group (None = pyarrow default).
+        :param write_statistics: write min/max/null-count column chunk statistics
+                                 (True, False or a list of columns).
+        :param write_page_index: also write the page index (per-page min/max) so readers
+                                 can skip pages, not only row groups.
+        """
+        self.typed = typed
+        self.sample_rows = sample_rows
+        self.dictionary_ratio = dictionary_ratio
+        self.max_dictionary_values = max_dictionary_values
+        self.column_types = dict(column_types) if column_types else {}
+        self.compression = compression
+        self.compression_level = compression_level
+        self.row_group_size = row_group_size
+        self.write_statistics = write_statistics
+        self.write_page_index = write_page_index
+
+    def schema(self, column_names, sample=None):
+        """
+        Output schema for `column_names`; `sample` (all-string Table of the first
+        rows) is needed when typed=True.
+        """
+        fields = []
+        for name in column_names:
+            if name in self.column_types:
+                type_ = self.column_types[name]
+            elif self.typed:
+                type_ = infer_column_type(sample.column(name), self.dictionary_ratio, self.max_dictionary_values)
+            else:
+                type_ = pa.string()
+            fields.append(pa.field(name, type_))
+        return pa.schema(fields)
+
+    def writer_options(self):
+        """Keyword arguments for pq.ParquetWriter/pq.write_table."""
+        options = {"compression": self.compression}
+        if self.compression_level is not None:
+            options["compression_level"] = self.compression_level
+        if self.write_statistics is not True:
+            options["write_statistics"] = self.write_statistics
+        if self.write_page_index:
+            options["write_page_index"] = True
+        return options
+
+    def describe(self, schema):
+        types = ", ".join(f"{field.name}: {field.type}" for field in schema)
+        level = f" level {self.compression_level}" if self.compression_level is not None else ""
+        return f"{self.compression}{level}, columns [{types}]"
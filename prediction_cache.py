@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class PredictionCache:
+    """
+    Persistent, content-addressed cache of LLM predictions backed by SQLite.
+
+    The key is a SHA-256 of the normalized text, the system prompt, the model
+    name and any extra request options, so changing the prompt or the model
+    never returns a stale answer. Entries older than `max_age_days` are treated
+    as misses, and the table is trimmed to `max_entries` (least recently used
+    first) every `evict_every` writes and on close().
+
+    Safe to share between the worker threads of Model_predictor.run_prediction.
+    """
+
+    def __init__(self, path="prediction_cache.sqlite", max_entries=None, max_age_days=None, evict_every=1000):
+        """
+        :param path: SQLite file; parent folders are created if missing.
+        :param max_entries: keep at most this many entries (None = unlimited).
+        :param max_age_days: entries older than this are ignored and evicted (None = never expire).
+        :param evict_every: run eviction after this many new entries.
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86400 if max_age_days is not None else None
+        self.evict_every = evict_every
+
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS predictions_accessed_at ON predictions (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_text(text):
+        # NFC + collapsed whitespace, so trivially different copies of a comment share one entry
+        return _WHITESPACE_PATTERN.sub(' ', unicodedata.normalize("NFC", str(text))).strip()
+
+    def make_key(self, text, system_prompt, model, options=None):
+        """
+        Build the cache key for one request.
+
+        :param text: user text sent to the model.
+        :param system_prompt: system prompt of the task.
+        :param model: model name.
+        :param options: any other request fields that change the answer (format, options, ...).
+        :return: hex SHA-256 digest.
+        """
+        material = json.dumps(
+            [self.normalize_text(text), system_prompt, model, options or {}],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age_seconds is not None and now - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE predictions SET accessed_at = ? WHERE key = ?", (now, key))
+            # no fsync in WAL mode with synchronous=NORMAL, and an open write
+            # transaction would otherwise hold the database lock until the next put
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predictions (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_every:
+                self._evict_locked()
+            else:
+                self._conn.commit()
+
+    def evict(self):
+        """Delete expired entries and trim the table to `max_entries`."""
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        if self.max_age_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM predictions WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+            )
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM predictions WHERE key IN ("
+                " SELECT key FROM predictions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        self._conn.commit()
+        self._writes_since_evict = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def stats(self):
+        """
+        :return: dict with hits, misses, hit_rate and the number of stored entries.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._evict_locked()
+            self._conn.close()
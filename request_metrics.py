@@ -0,0 +1,272 @@
+import json
+import os
+import threading
+
+
+# Bucket upper bounds, Prometheus style (an implicit +Inf bucket follows)
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0]
+RATE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+# Time components of one request, in the order they are reported
+TIME_COMPONENTS = ["wall", "server", "load", "prompt_eval", "decode", "queue_network"]
+RATE_COMPONENTS = ["prompt", "decode"]
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Fixed-bucket histogram with a running sum, as exported to Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile by linear interpolation inside its bucket (like
+        histogram_quantile), clamped to the smallest and largest observed values.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        estimate = self.max
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i < len(self.buckets):
+                    lower = self.buckets[i - 1] if i else 0.0
+                    estimate = lower + (self.buckets[i] - lower) * (rank - seen) / count
+                break
+            seen += count
+        return min(max(estimate, self.min), self.max)
+
+    def cumulative(self):
+        # (upper bound, cumulative count) pairs ending with +Inf
+        total = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            total += count
+            yield bound, total
+
+    def summary(self):
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6),
+            "p50": round(self.quantile(0.50), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+        }
+
+
+class _Series:
+    # every histogram and counter of one (task, model) pair
+    def __init__(self, latency_buckets, rate_buckets):
+        self.seconds = {name: Histogram(latency_buckets) for name in TIME_COMPONENTS}
+        self.tokens_per_second = {name: Histogram(rate_buckets) for name in RATE_COMPONENTS}
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+
+
+class RequestMetrics:
+    """
+    Per-request latency and token-throughput instrumentation for chat calls.
+
+    record() is called once per HTTP attempt with the client-side wall time
+    and the response body. From an Ollama response it takes total_duration,
+    load_duration, prompt_eval_duration/count and eval_duration/count and
+    derives the time spent outside the server (queueing in the proxy plus
+    network, wall - total_duration) and the prompt and decode tokens/sec. An
+    OpenAI compatible response only gives token counts. Everything is kept in
+    histograms per (task, model) and can be exported as JSON or Prometheus text.
+
+    Safe to share between the worker threads of Model_predictor.
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, rate_buckets=RATE_BUCKETS):
+        """
+        :param latency_buckets: upper bounds in seconds of the time histograms.
+        :param rate_buckets: upper bounds in tokens/sec of the throughput histograms.
+        """
+        self.latency_buckets = list(latency_buckets)
+        self.rate_buckets = list(rate_buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, task, model):
+        series = self._series.get((task, model))
+        if series is None:
+            series = self._series[(task, model)] = _Series(self.latency_buckets, self.rate_buckets)
+        return series
+
+    def record(self, task, model, wall_seconds, status=None, response_text=None):
+        """
+        Record one request.
+
+        :param task: task name, e.g. "sentiment" or "sentiment_batch".
+        :param model: model name.
+        :param wall_seconds: client-side time from sending the request to reading the body.
+        :param status: HTTP status code, None if the request raised.
+        :param response_text: response body, parsed for the Ollama timing fields.
+        """
+        data = None
+        if response_text and status is not None and status < 400:
+            try:
+                data = json.loads(response_text)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                data = None
+
+        with self._lock:
+            series = self._get_series(task, model)
+            series.requests += 1
+            series.seconds["wall"].observe(wall_seconds)
+            if data is None:
+                if status is None or status >= 400:
+                    series.errors += 1
+                return
+
+            usage = data.get("usage") or {}
+            prompt_tokens = data.get("prompt_eval_count", usage.get("prompt_tokens")) or 0
+            eval_tokens = data.get("eval_count", usage.get("completion_tokens")) or 0
+            series.prompt_tokens += prompt_tokens
+            series.eval_tokens += eval_tokens
+
+            if data.get("total_duration") is None:
+                return
+            # Ollama durations are in nanoseconds
+            server = data["total_duration"] / 1e9
+            prompt_eval = (data.get("prompt_eval_duration") or 0) / 1e9
+            decode = (data.get("eval_duration") or 0) / 1e9
+            series.seconds["server"].observe(server)
+            series.seconds["load"].observe((data.get("load_duration") or 0) / 1e9)
+            series.seconds["prompt_eval"].observe(prompt_eval)
+            series.seconds["decode"].observe(decode)
+            series.seconds["queue_network"].observe(max(0.0, wall_seconds - server))
+            if prompt_eval > 0 and prompt_tokens:
+                series.tokens_per_second["prompt"].observe(prompt_tokens / prompt_eval)
+            if decode > 0 and eval_tokens:
+                series.tokens_per_second["decode"].observe(eval_tokens / decode)
+
+    def summary(self):
+        """
+        :return: list of one dict per (task, model) with request/error/token counts,
+                 a summary (count, sum, mean, p50, p95, p99) of every time and
+                 tokens/sec histogram, and the share of the summed wall time spent
+                 in load, prompt eval, decode, the rest of the server and queue/network.
+        """
+        with self._lock:
+            rows = []
+            for (task, model), series in sorted(self._series.items()):
+                wall = series.seconds["wall"].sum
+                server = series.seconds["server"].sum
+                parts = {
+                    "load": series.seconds["load"].sum,
+                    "prompt_eval": series.seconds["prompt_eval"].sum,
+                    "decode": series.seconds["decode"].sum,
+                }
+                parts["server_other"] = max(0.0, server - sum(parts.values()))
+                parts["queue_network"] = series.seconds["queue_network"].sum
+                rows.append({
+                    "task": task,
+                    "model": model,
+                    "requests": series.requests,
+                    "errors": series.errors,
+                    "prompt_tokens": series.prompt_tokens,
+                    "eval_tokens": series.eval_tokens,
+                    "seconds": {name: h.summary() for name, h in series.seconds.items()},
+                    "tokens_per_second": {name: h.summary() for name, h in series.tokens_per_second.items()},
+                    "time_share": {name: round(value / wall, 4) if wall else None for name, value in parts.items()},
+                })
+            return rows
+
+    def format_summary(self):
+        """One printable line per (task, model)."""
+        lines = []
+        for row in self.summary():
+            wall = row["seconds"]["wall"]
+            decode_rate = row["tokens_per_second"]["decode"]
+            line = f"Timing [{row['task']}]: {row['requests']:,} calls, {row['errors']:,} errors"
+            if wall["count"]:
+                line += f", wall p50 {wall['p50']:.3f}s p95 {wall['p95']:.3f}s"
+            shares = [f"{name} {share:.0%}" for name, share in row["time_share"].items() if share]
+            if shares:
+                line += ", " + ", ".join(shares)
+            if decode_rate["count"]:
+                line += f", decode {decode_rate['mean']:.1f} tok/s"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def to_json(self, indent=2):
+        return json.dumps(self.summary(), indent=indent, ensure_ascii=False)
+
+    def to_prometheus(self, prefix="ollama_chat"):
+        """
+        :return: the histograms and counters in the Prometheus text exposition format.
+        """
+        def labels(task, model, **extra):
+            pairs = {"task": task, "model": model, **extra}
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs.items()) + "}"
+
+        def le(bound):
+            return "+Inf" if bound == float("inf") else repr(float(bound))
+
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items())
+            for name, help_text in (("requests_total", "Chat requests sent."),
+                                    ("errors_total", "Chat requests that failed or got an error status."),
+                                    ("prompt_tokens_total", "Prompt tokens evaluated."),
+                                    ("eval_tokens_total", "Tokens generated.")):
+                lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} counter"]
+                attribute = name[:-len("_total")]
+                for (task, model), series in items:
+                    lines.append(f"{prefix}_{name}{labels(task, model)} {getattr(series, attribute)}")
+
+            groups = [(f"{component}_seconds", "seconds", component) for component in TIME_COMPONENTS]
+            groups += [(f"{component}_tokens_per_second", "tokens_per_second", component) for component in RATE_COMPONENTS]
+            for metric, kind, component in groups:
+                lines += [f"# HELP {prefix}_{metric} Per-request {component.replace('_', ' ')} {kind.replace('_', ' ')}.",
+                          f"# TYPE {prefix}_{metric} histogram"]
+                for (task, model), series in items:
+                    histogram = getattr(series, kind)[component]
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{prefix}_{metric}_bucket{labels(task, model, le=le(bound))} {count}")
+                    lines.append(f"{prefix}_{metric}_sum{labels(task, model)} {histogram.sum}")
+                    lines.append(f"{prefix}_{metric}_count{labels(task, model)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """
+        Write the metrics to `path`: Prometheus text for .prom/.txt files
+        (e.g. for the node_exporter textfile collector), JSON otherwise.
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        content = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
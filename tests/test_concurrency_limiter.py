@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+import concurrency_limiter
+from concurrency_limiter import AIMDConcurrencyLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(concurrency_limiter.time, "monotonic", clock)
+    return clock
+
+
+def _answer(limiter, clock, latency, status=200, key=None):
+    limiter.acquire()
+    clock.now += latency
+    limiter.release(latency=latency, status=status, key=key)
+
+
+def test_steady_latency_increases_by_about_one_per_round_trip(clock):
+    limiter = AIMDConcurrencyLimiter(initial_limit=4, max_limit=10)
+    for _ in range(4):
+        _answer(limiter, clock, 0.1)
+    assert limiter.increases == 4
+    assert limiter.current_limit == 4
+    for _ in range(5):
+        _answer(limiter, clock, 0.1)
+    assert limiter.current_limit == 5
+    assert limiter.decreases == 0
+
+    for _ in range(200):
+        _answer(limiter, clock, 0.1)
+    assert limiter.current_limit == 10
+
+
+def test_errors_decrease_once_per_round_trip(clock):
+    limiter = AIMDConcurrencyLimiter(initial_limit=8, backoff=0.5)
+    _answer(limiter, clock, 1.0)
+
+    _answer(limiter, clock, 0.01, status=503)
+    assert limiter.current_limit == 4
+    # the same burst: less than one smoothed round trip (1 s) later
+    _answer(limiter, clock, 0.01, status=429)
+    limiter.acquire()
+    limiter.release(error=True)
+    assert limiter.current_limit == 4 and limiter.decreases == 1
+
+    clock.now += 1.0
+    limiter.acquire()
+    limiter.release(error=True)
+    assert limiter.current_limit == 2 and limiter.decreases == 2
+
+
+def test_other_statuses_leave_the_limit_alone(clock):
+    limiter = AIMDConcurrencyLimiter(initial_limit=8)
+    _answer(limiter, clock, 0.1, status=404)
+    _answer(limiter, clock, 0.1, status=400)
+    assert limiter.limit == 8.0
+    assert limiter.stats()["min_latency"] == {}
+
+
+def test_queueing_latency_decreases_the_limit(clock):
+    limiter = AIMDConcurrencyLimiter(initial_limit=20, smoothing=0.5, latency_tolerance=2.0)
+    for _ in range(5):
+        _answer(limiter, clock, 0.1)
+    assert limiter.decreases == 0
+
+    for _ in range(3):
+        _answer(limiter, clock, 1.0)
+    assert limiter.decreases >= 1
+    assert limiter.current_limit < 20
+
+
+def test_latencies_are_kept_per_task(clock):
+    limiter = AIMDConcurrencyLimiter(initial_limit=10, smoothing=0.5)
+    for _ in range(5):
+        _answer(limiter, clock, 0.1, key="sentiment")
+    # a long task is not queueing just because it is slower than a short one
+    for _ in range(5):
+        _answer(limiter, clock, 1.0, key="category")
+    assert limiter.decreases == 0
+    stats = limiter.stats()
+    assert stats["min_latency"] == {"sentiment": 0.1, "category": 1.0}
+
+    for _ in range(3):
+        _answer(limiter, clock, 1.0, key="sentiment")
+    assert limiter.decreases >= 1
+
+
+def test_a_lucky_fast_answer_expires_after_two_windows(clock):
+    limiter = AIMDConcurrencyLimiter(baseline_window=10.0)
+    _answer(limiter, clock, 0.01)
+    _answer(limiter, clock, 1.0)
+    assert limiter.stats()["min_latency"][None] == 0.01
+
+    for _ in range(25):
+        clock.now += 1.0
+        _answer(limiter, clock, 1.0)
+    assert limiter.stats()["min_latency"][None] == 1.0
+
+
+def test_async_acquire_waits_for_a_slot():
+    limiter = AIMDConcurrencyLimiter(initial_limit=2, max_limit=2)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        await limiter.acquire_async()
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.01)
+        await limiter.release_async(latency=0.01, status=200, key="sentiment")
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(8)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.in_flight == 0
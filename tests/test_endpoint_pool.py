@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from benchmarks.stub_ollama import StubOllamaServer
+from endpoint_pool import EndpointPool
+
+
+@pytest.fixture
+def backends():
+    servers = [StubOllamaServer().start() for _ in range(2)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def _fail(pool, url):
+    # a request to `url` that ended in a connection error or a 5xx
+    pool.outstanding[url] += 1
+    pool.served[url] += 1
+    pool.release(url, ok=False)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_failures_eject_and_health_check_readmits(backends):
+    urls = [server.url + "/api/chat" for server in backends]
+    pool = EndpointPool(urls, failure_threshold=3)
+
+    _fail(pool, urls[0])
+    _fail(pool, urls[0])
+    assert pool.healthy[urls[0]]
+
+    _fail(pool, urls[0])
+    assert not pool.healthy[urls[0]]
+    assert pool.ejections == 1
+    assert {pool.acquire() for _ in range(10)} == {urls[1]}
+
+    # the backend never went away, so its next probe brings it back
+    assert pool.check(urls[0])
+    assert pool.healthy[urls[0]] and pool.failures[urls[0]] == 0
+    assert pool.readmissions == 1
+
+
+def test_success_resets_the_failure_count_and_abandoned_requests_do_not(backends):
+    url = backends[0].url + "/api/chat"
+    pool = EndpointPool([url], failure_threshold=2)
+    for ok in (False, True, False, True, False):
+        pool.release(pool.acquire(), ok=ok)
+    assert pool.healthy[url]
+
+    # a lost hedge says nothing about the endpoint: the failure streak goes on
+    pool.release(pool.acquire(), ok=None)
+    pool.release(pool.acquire(), ok=False)
+    assert not pool.healthy[url]
+    assert pool.outstanding[url] == 0
+
+
+def test_background_checks_follow_a_backend_going_down_and_up(backends):
+    down, up = backends
+    port = int(down.url.rsplit(":", 1)[1])
+    urls = [down.url + "/api/chat", up.url + "/api/chat"]
+    down.stop()
+
+    pool = EndpointPool(urls, health_check_interval=0.05, health_timeout=0.5).start()
+    try:
+        assert _wait_for(lambda: not pool.healthy[urls[0]])
+        assert {pool.acquire() for _ in range(10)} == {urls[1]}
+
+        backends[0] = StubOllamaServer(port=port).start()
+        assert _wait_for(lambda: pool.healthy[urls[0]])
+        assert pool.ejections == 1 and pool.readmissions == 1
+    finally:
+        pool.stop()
+
+
+def test_all_ejected_still_routes_to_least_loaded(backends):
+    urls = [server.url + "/api/chat" for server in backends]
+    pool = EndpointPool(urls, failure_threshold=1)
+    for url in urls:
+        _fail(pool, url)
+    assert not any(pool.healthy.values())
+
+    busy = pool.acquire()
+    assert pool.acquire() != busy
@@ -0,0 +1,74 @@
+import pyarrow.parquet as pq
+
+from Chunked_Pandas_to_Parquet import layout_schema, read_csv_header
+from many_small_Parquet_files import _convert_byte_range, record_aligned_ranges
+from parquet_layout import ParquetLayout
+
+SEP = "¦"
+ROWS = [
+    ["1", "plain comment", "ok"],
+    ["2", "first line\nsecond line", "newline inside quotes"],
+    ["3", "price 5¦6 ¦ \"quoted\"", "separator and quotes inside"],
+    ["4", "ends with a newline\n", ""],
+    ["5", "مبروك\n😍¦\n", "arabic, emoji and both"],
+    ["6", "last", "no trailing newline issue"],
+]
+
+
+def _field(value):
+    if any(char in value for char in (SEP, "\n", '"')):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _write_csv(path):
+    # returns the byte offset at which every data record starts, plus the end of file
+    data = (SEP.join(["id", "text", "note"]) + "\n").encode("utf-8")
+    starts = []
+    for row in ROWS:
+        starts.append(len(data))
+        data += (SEP.join(_field(value) for value in row) + "\n").encode("utf-8")
+    path.write_bytes(data)
+    return starts + [len(data)], data
+
+
+def test_every_range_ends_on_a_record_boundary(tmp_path):
+    path = tmp_path / "comments.csv"
+    boundaries, data = _write_csv(path)
+
+    for max_bytes in range(1, len(data) + 2):
+        header_end, ranges = record_aligned_ranges(str(path), max_bytes)
+        assert header_end == boundaries[0]
+        assert ranges[0][0] == header_end and ranges[-1][1] == len(data)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert end == start
+        assert all(end in boundaries for _, end in ranges), max_bytes
+
+
+def _convert_ranges(path, ranges, tmp_path):
+    layout = ParquetLayout()
+    column_names = read_csv_header(str(path), SEP)
+    schema = layout_schema(str(path), column_names, SEP, layout)
+    rows = []
+    for index, (start, end) in enumerate(ranges):
+        parquet_path = str(tmp_path / f"part{index}.parquet")
+        _convert_byte_range(str(path), start, end, column_names, SEP, parquet_path, schema, layout)
+        table = pq.read_table(parquet_path)
+        rows += [[value or "" for value in row.values()] for row in table.to_pylist()]
+    return rows
+
+
+def test_range_boundary_inside_quoted_separator(tmp_path):
+    path = tmp_path / "comments.csv"
+    boundaries, data = _write_csv(path)
+    header_end = boundaries[0]
+
+    # aim the first cut between the two bytes of the "¦" embedded in row 3,
+    # then at the quoted newline of row 2
+    embedded = data.index("5¦6".encode("utf-8")) + 1
+    assert data[embedded:embedded + 2] == SEP.encode("utf-8")
+    quoted_newline = data.index(b"first line\n") + len(b"first line")
+    for cut in (embedded + 1, quoted_newline):
+        _, ranges = record_aligned_ranges(str(path), cut - header_end)
+        assert len(ranges) > 1
+        assert _convert_ranges(path, ranges, tmp_path) == ROWS
@@ -0,0 +1,52 @@
+import os
+import random
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from many_small_Parquet_files2 import _RollingParquetWriter
+from parquet_layout import ParquetLayout
+
+MAX_BYTES = 1024 * 1024
+SCHEMA = pa.schema([("Comment_pk", pa.string()), ("Comment_text", pa.string())])
+
+
+def _batch(rnd, rows, start, compressible):
+    if compressible:
+        texts = ["the same comment, again and again " * 3] * rows
+    else:
+        texts = ["".join(rnd.choices("abcdefghijklmnopqrstuvwxyz0123456789 ", k=120)) for _ in range(rows)]
+    return pa.record_batch([pa.array([f"c{i:07d}" for i in range(start, start + rows)]), pa.array(texts)],
+                           schema=SCHEMA)
+
+
+@pytest.mark.parametrize("layout", [ParquetLayout(), ParquetLayout(compression="zstd")])
+def test_every_part_stays_under_max_bytes(tmp_path, layout):
+    # compressible blocks first, so the compression ratio learned early is far
+    # too optimistic for the random text that follows
+    rnd = random.Random(0)
+    writer = _RollingParquetWriter(str(tmp_path / "out"), SCHEMA, MAX_BYTES, layout)
+    total_rows = 0
+    for compressible in [True] * 4 + [False] * 6 + [True, False] * 3:
+        batch = _batch(rnd, 20_000, total_rows, compressible)
+        writer.write_batch(batch)
+        total_rows += batch.num_rows
+    paths = writer.close()
+
+    assert len(paths) > 1
+    assert all(os.path.getsize(path) <= MAX_BYTES for path in paths)
+    table = pa.concat_tables(pq.read_table(path) for path in paths)
+    assert table.num_rows == total_rows
+    assert table["Comment_pk"].to_pylist() == [f"c{i:07d}" for i in range(total_rows)]
+
+
+def test_discard_removes_every_part(tmp_path):
+    rnd = random.Random(0)
+    writer = _RollingParquetWriter(str(tmp_path / "out"), SCHEMA, MAX_BYTES)
+    for start in range(0, 60_000, 20_000):
+        writer.write_batch(_batch(rnd, 20_000, start, compressible=False))
+    assert len(writer.paths) > 1
+
+    writer.discard()
+    assert os.listdir(tmp_path) == []
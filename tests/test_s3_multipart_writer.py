@@ -0,0 +1,64 @@
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from SA_Modeling_ollama import S3MultipartWriter
+
+BUCKET = "sa-results"
+PART_SIZE = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _open_uploads(s3_client):
+    return s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", [])
+
+
+def test_close_uploads_all_parts(s3_client):
+    data = bytes(range(256)) * (3 * PART_SIZE // 256 + 100)
+    writer = S3MultipartWriter(s3_client, BUCKET, "out.parquet", part_size=PART_SIZE, max_concurrency=2)
+    for start in range(0, len(data), 1024 * 1024):
+        writer.write(data[start:start + 1024 * 1024])
+    writer.close()
+
+    assert s3_client.get_object(Bucket=BUCKET, Key="out.parquet")["Body"].read() == data
+    assert _open_uploads(s3_client) == []
+
+
+def test_abort_cancels_the_upload_and_stops_the_pool(s3_client):
+    writer = S3MultipartWriter(s3_client, BUCKET, "out.parquet", part_size=PART_SIZE, max_concurrency=2)
+    writer.write(b"x" * (3 * PART_SIZE))
+    assert len(_open_uploads(s3_client)) == 1
+
+    writer.abort()
+
+    assert _open_uploads(s3_client) == []
+    assert s3_client.list_objects_v2(Bucket=BUCKET).get("KeyCount") == 0
+    assert not any(thread.is_alive() for thread in writer._executor._threads)
+
+
+def test_failed_part_aborts_on_close(s3_client, monkeypatch):
+    writer = S3MultipartWriter(s3_client, BUCKET, "out.parquet", part_size=PART_SIZE, max_concurrency=2)
+    upload_part = s3_client.upload_part
+
+    def flaky_upload_part(**kwargs):
+        if kwargs["PartNumber"] == 2:
+            raise RuntimeError("connection reset")
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(s3_client, "upload_part", flaky_upload_part)
+    writer.write(b"x" * (2 * PART_SIZE + 10))
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+    assert _open_uploads(s3_client) == []
+    assert s3_client.list_objects_v2(Bucket=BUCKET).get("KeyCount") == 0
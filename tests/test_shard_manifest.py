@@ -0,0 +1,67 @@
+import json
+import os
+
+import pandas as pd
+
+from SA_Modeling_ollama import Model_predictor
+
+
+def _frame(start, stop):
+    return pd.DataFrame({
+        "Comment_pk": [f"c{i:04d}" for i in range(start, stop)],
+        "Comment_text": [f"comment {i}" for i in range(start, stop)],
+    })
+
+
+def _predictor(monkeypatch, calls):
+    ai = Model_predictor()
+
+    def fake_predict_frame(df, processCol, **options):
+        calls.extend(df["Comment_pk"])
+        return df.assign(SA_sentiment="Neutral")
+
+    monkeypatch.setattr(ai, "_predict_frame", fake_predict_frame)
+    return ai
+
+
+def _run(ai, df, folder, resume):
+    chunks = (df.iloc[start:start + 5] for start in range(0, len(df), 5))
+    return ai.run_prediction_stream(chunks, "Comment_text", str(folder), "out", resume=resume)
+
+
+def test_resume_after_torn_manifest_line(tmp_path, monkeypatch):
+    calls = []
+    ai = _predictor(monkeypatch, calls)
+    _run(ai, _frame(0, 10), tmp_path, resume=False)
+
+    # crash in the middle of appending the next manifest entry
+    manifest_path = os.path.join(tmp_path, "out", "shards", "manifest.jsonl")
+    with open(manifest_path, "a", encoding="utf-8") as f:
+        f.write('{"shard": "part-00003.parquet", "Comment_pk": ["c00')
+
+    calls.clear()
+    output_path = _run(ai, _frame(0, 20), tmp_path, resume=True)
+    assert sorted(calls) == [f"c{i:04d}" for i in range(10, 20)]
+    assert len(pd.read_csv(output_path)) == 20
+
+    calls.clear()
+    output_path = _run(ai, _frame(0, 30), tmp_path, resume=True)
+    assert sorted(calls) == [f"c{i:04d}" for i in range(20, 30)]
+    assert sorted(pd.read_csv(output_path)["Comment_pk"]) == [f"c{i:04d}" for i in range(30)]
+
+    with open(manifest_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert all(json.loads(line) for line in lines)
+
+
+def test_manifest_entry_without_newline_is_not_counted(tmp_path):
+    shard_folder = tmp_path / "shards"
+    shard_folder.mkdir()
+    complete = json.dumps({"shard": "part-00001.parquet", "Comment_pk": ["a"]}) + "\n"
+    unterminated = json.dumps({"shard": "part-00002.parquet", "Comment_pk": ["b"]})
+    (shard_folder / "manifest.jsonl").write_text(complete + unterminated, encoding="utf-8")
+
+    ai = Model_predictor()
+    assert [entry["shard"] for entry in ai._read_manifest(str(shard_folder))] == ["part-00001.parquet"]
+    ai._read_manifest(str(shard_folder), repair=True)
+    assert (shard_folder / "manifest.jsonl").read_text(encoding="utf-8") == complete